@@ -0,0 +1,375 @@
+"""In-process stand-ins for `spotipy.Spotify` and `tidalapi.session.Session`.
+
+They serve a synthetic library with simulated latency, pagination, rate limits
+and transient errors, and count every call per endpoint.
+"""
+
+import datetime
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+import requests
+from tidalapi.exceptions import ObjectNotFound, TooManyRequests
+
+ADJECTIVES = ['neon', 'silent', 'golden', 'broken', 'electric', 'velvet', 'hollow', 'burning', 'paper', 'crystal',
+              'midnight', 'wild', 'lonely', 'bright', 'frozen', 'secret']
+NOUNS = ['river', 'heart', 'city', 'dream', 'machine', 'garden', 'ocean', 'signal', 'mirror', 'highway', 'fire',
+         'shadow', 'echo', 'satellite', 'summer', 'ghost']
+
+# Saved date of the newest saved track and album
+ADDED_AT = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+class Network:
+    """Simulated server behaviour shared by both fakes.
+
+    Rate limits and connection errors only hit Tidal: spotipy already retries
+    429s and dropped connections inside its own requests session.
+    """
+
+    def __init__(self, latency=0.005, jitter=0.5, rate_limit=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+
+    def call(self, service, endpoint):
+        with self._lock:
+            self.calls[f"{service}.{endpoint}"] += 1
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_calls = now, 0
+            self._window_calls += 1
+            faulty = service != 'spotify'
+            limited = faulty and self.rate_limit is not None and self._window_calls > self.rate_limit
+            failed = faulty and self._random.random() < self.error_rate
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+        if limited:
+            raise TooManyRequests(retry_after=0)
+        if failed:
+            raise requests.ConnectionError(f"simulated {service} connection reset")
+
+
+def _added_at(index):
+    # Spotify lists saved items newest first; each one here was saved a second before the previous one
+    added = ADDED_AT - datetime.timedelta(seconds=index)
+    return added.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _words(text):
+    return set(re.findall(r'\w+', text.casefold()))
+
+
+class Library:
+    """A synthetic Spotify library and the Tidal catalog it should map onto.
+
+    `truth` maps `(section, spotify_id)` to the Tidal ID a perfect matcher picks,
+    or None for items Tidal does not carry. The catalog also holds decoys: live
+    versions, namesakes by other artists and remasters with retitled names.
+    """
+
+    def __init__(self, size, seed=0, isrc_rate=0.8, missing_rate=0.05, decoy_rate=0.3):
+        rng = random.Random(seed)
+        self.truth = {}
+        self.tidal_tracks = {}
+        self.tidal_albums = {}
+        self.tidal_artists = {}
+        self.saved_tracks = []
+        self.saved_albums = []
+        self.followed_artists = []
+        self.playlists = []
+        self.playlist_items = {}
+        next_id = iter(range(1, 10 ** 9)).__next__
+
+        artist_count = max(size // 20, 5)
+        artists = []
+        for index in range(artist_count):
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}s {index}".title()
+            tidal_artist = SimpleNamespace(id=next_id(), name=name)
+            self.tidal_artists[tidal_artist.id] = tidal_artist
+            artists.append(({'id': f'sa{index}', 'name': name, 'type': 'artist'}, tidal_artist))
+
+        album_count = max(size // 10, 5)
+        albums = []
+        for index in range(album_count):
+            spotify_artist, tidal_artist = artists[rng.randrange(artist_count)]
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {index}".title()
+            upc = f"{index:012d}" if rng.random() < isrc_rate else None
+            tidal_album = SimpleNamespace(id=next_id(), name=name, artists=[tidal_artist], num_tracks=10, upc=upc)
+            spotify_album = {'id': f'sal{index}', 'name': name, 'artists': [spotify_artist], 'total_tracks': 10,
+                             'external_ids': {'upc': upc} if upc else {}}
+            missing = rng.random() < missing_rate
+            if not missing:
+                self.tidal_albums[tidal_album.id] = tidal_album
+            self.truth[('albums', spotify_album['id'])] = None if missing else str(tidal_album.id)
+            albums.append((spotify_album, tidal_album))
+
+        for index in range(size):
+            spotify_album, tidal_album = albums[rng.randrange(album_count)]
+            spotify_artist = spotify_album['artists'][0]
+            tidal_artist = tidal_album.artists[0]
+            title = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {index}".title()
+            duration = rng.randint(120, 420)
+            isrc = f"QZ{index:010d}" if rng.random() < isrc_rate else None
+            spotify_title = title
+            if rng.random() < decoy_rate / 3:
+                spotify_title = f"{title} - Remastered {rng.randint(1995, 2020)}"
+            featured = []
+            if rng.random() < decoy_rate / 3:
+                featured = [artists[rng.randrange(artist_count)]]
+
+            tidal_track = SimpleNamespace(id=next_id(), name=title, duration=duration, isrc=isrc,
+                                          artists=[tidal_artist] + [tidal for _, tidal in featured],
+                                          album=tidal_album)
+            missing = rng.random() < missing_rate
+            if not missing:
+                self.tidal_tracks[tidal_track.id] = tidal_track
+            if rng.random() < decoy_rate:
+                live = SimpleNamespace(id=next_id(), name=f"{title} (Live)", duration=duration + rng.randint(20, 90),
+                                       isrc=None, artists=[tidal_artist], album=tidal_album)
+                namesake_artist = artists[rng.randrange(artist_count)][1]
+                namesake = SimpleNamespace(id=next_id(), name=title, duration=rng.randint(120, 420), isrc=None,
+                                           artists=[namesake_artist], album=tidal_album)
+                self.tidal_tracks[live.id] = live
+                if namesake_artist is not tidal_artist:
+                    self.tidal_tracks[namesake.id] = namesake
+
+            track = {'id': f'st{index}', 'name': spotify_title, 'type': 'track', 'duration_ms': duration * 1000,
+                     'artists': [spotify_artist] + [spotify for spotify, _ in featured], 'album': spotify_album,
+                     'external_ids': {'isrc': isrc} if isrc else {}}
+            self.truth[('tracks', track['id'])] = None if missing else str(tidal_track.id)
+            self.saved_tracks.append({'added_at': _added_at(index), 'track': track})
+
+        self.saved_albums = [{'added_at': _added_at(index), 'album': album}
+                             for index, (album, _) in enumerate(albums[:max(size // 10, 1)])]
+        for spotify_artist, tidal_artist in artists[:max(size // 50, 1)]:
+            self.followed_artists.append(spotify_artist)
+            self.truth[('artists', spotify_artist['id'])] = str(tidal_artist.id)
+
+        for index in range(max(size // 100, 1)):
+            playlist = {'id': f'sp{index}', 'name': f"Mix {index}", 'owner': {'id': 'bench-user'},
+                        'snapshot_id': f'snap{index}'}
+            self.playlists.append(playlist)
+            length = rng.randint(50, 200)
+            self.playlist_items[playlist['id']] = [{'track': rng.choice(self.saved_tracks)['track']}
+                                                   for _ in range(length)]
+
+        self._index = {'tracks': defaultdict(set), 'albums': defaultdict(set), 'artists': defaultdict(set)}
+        for kind, catalog in (('tracks', self.tidal_tracks), ('albums', self.tidal_albums),
+                              ('artists', self.tidal_artists)):
+            for obj in catalog.values():
+                names = [obj.name] + [artist.name for artist in getattr(obj, 'artists', [])]
+                for word in _words(' '.join(names)):
+                    self._index[kind][word].add(obj.id)
+
+    def search(self, kind, query, limit):
+        catalog = {'tracks': self.tidal_tracks, 'albums': self.tidal_albums, 'artists': self.tidal_artists}[kind]
+        scores = Counter()
+        for word in _words(query):
+            for obj_id in self._index[kind].get(word, ()):
+                scores[obj_id] += 1
+        ranked = sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[:limit]
+        return [catalog[obj_id] for obj_id, _ in ranked]
+
+
+class FakeSpotify:
+    """Implements the slice of `spotipy.Spotify` the transfer engine uses."""
+
+    def __init__(self, library, network):
+        self.library = library
+        self.network = network
+
+    def _page(self, endpoint, items, offset, limit, container=None):
+        self.network.call('spotify', endpoint)
+        has_next = offset + limit < len(items)
+        page = {'items': items[offset:offset + limit], 'total': len(items), 'offset': offset, 'limit': limit,
+                'next': {'endpoint': endpoint, 'items': items, 'offset': offset + limit, 'limit': limit,
+                         'container': container} if has_next else None}
+        return {container: page} if container else page
+
+    def next(self, result):
+        cursor = result['next']
+        return self._page(cursor['endpoint'], cursor['items'], cursor['offset'], cursor['limit'],
+                          cursor['container'])
+
+    def me(self):
+        self.network.call('spotify', 'me')
+        return {'id': 'bench-user'}
+
+    def current_user_saved_tracks(self, limit=20):
+        return self._page('saved_tracks', self.library.saved_tracks, 0, limit)
+
+    def current_user_saved_albums(self, limit=20):
+        return self._page('saved_albums', self.library.saved_albums, 0, limit)
+
+    def current_user_followed_artists(self, limit=20):
+        return self._page('followed_artists', self.library.followed_artists, 0, limit, container='artists')
+
+    def current_user_playlists(self, limit=50):
+        return self._page('playlists', self.library.playlists, 0, limit)
+
+    def playlist_tracks(self, playlist_id, limit=100):
+        return self._page('playlist_tracks', self.library.playlist_items[playlist_id], 0, limit)
+
+
+class FakePlaylist:
+    def __init__(self, session, playlist_id, name):
+        self.session = session
+        self.id = playlist_id
+        self.name = name
+        self.items = []
+
+    def add(self, media_ids):
+        self.session.network.call('tidal', 'playlist.add')
+        known = set(self.items)
+        added = [media_id for media_id in media_ids if media_id not in known]
+        self.items.extend(added)
+        return added
+
+    def tracks(self, limit=None, offset=0):
+        self.session.network.call('tidal', 'playlist.tracks')
+        return [SimpleNamespace(id=media_id) for media_id in self.items[offset:offset + (limit or 1000)]]
+
+
+class FakeArtist:
+    def __init__(self, session, artist):
+        self.session = session
+        self.id = artist.id
+        self.name = artist.name
+
+    def _releases(self, limit, offset):
+        albums = self.session.albums_by_artist.get(self.id, [])[offset:offset + (limit or 50)]
+        return [FakeAlbum(self.session, album) for album in albums]
+
+    def get_albums(self, limit=None, offset=0):
+        self.session.network.call('tidal', 'artist.albums')
+        return self._releases(limit, offset)
+
+    def get_ep_singles(self, limit=None, offset=0):
+        self.session.network.call('tidal', 'artist.ep_singles')
+        return []
+
+
+class FakeAlbum:
+    def __init__(self, session, album):
+        self.session = session
+        self.id = album.id
+        self.name = album.name
+        self.artists = album.artists
+        self.num_tracks = album.num_tracks
+
+    def tracks(self, limit=None, offset=0):
+        self.session.network.call('tidal', 'album.tracks')
+        return self.session.tracks_by_album.get(self.id, [])[offset:offset + (limit or 100)]
+
+
+class FakeFavorites:
+    def __init__(self, session):
+        self.session = session
+        self.ids = {'tracks': [], 'albums': [], 'artists': []}
+
+    def _add(self, kind, ids):
+        self.session.network.call('tidal', f'favorites.add_{kind[:-1]}')
+        self.ids[kind].extend(str(obj_id) for obj_id in ([ids] if isinstance(ids, (str, int)) else ids))
+        return True
+
+    def add_track(self, track_id):
+        return self._add('tracks', track_id)
+
+    def add_album(self, album_id):
+        return self._add('albums', album_id)
+
+    def add_artist(self, artist_id):
+        return self._add('artists', artist_id)
+
+    def _list(self, kind, limit, offset):
+        self.session.network.call('tidal', f'favorites.{kind}')
+        return [SimpleNamespace(id=obj_id) for obj_id in self.ids[kind][offset:offset + limit]]
+
+    def tracks(self, limit=None, offset=0):
+        return self._list('tracks', limit or 1000, offset)
+
+    def albums(self, limit=None, offset=0):
+        return self._list('albums', limit or 1000, offset)
+
+    def artists(self, limit=None, offset=0):
+        return self._list('artists', limit or 1000, offset)
+
+
+class FakeUser:
+    def __init__(self, tidal, user_id):
+        self.id = user_id
+        self.favorites = FakeFavorites(tidal)
+        self.create_playlist = tidal.create_playlist
+        self.playlists = tidal.playlists
+
+
+class FakeTidal:
+    """Implements the slice of `tidalapi.session.Session` the transfer engine uses."""
+
+    def __init__(self, library, network, user_id=1):
+        self.library = library
+        self.network = network
+        self._playlists = {}
+        self.user = FakeUser(self, user_id)
+        self._isrc = defaultdict(list)
+        for track in library.tidal_tracks.values():
+            if track.isrc:
+                self._isrc[track.isrc].append(track)
+        self._upc = {album.upc: album for album in library.tidal_albums.values() if album.upc}
+        self.albums_by_artist = defaultdict(list)
+        for album in library.tidal_albums.values():
+            self.albums_by_artist[album.artists[0].id].append(album)
+        self.tracks_by_album = defaultdict(list)
+        for track in library.tidal_tracks.values():
+            self.tracks_by_album[track.album.id].append(track)
+
+    def search(self, query, models=None, limit=50, offset=0):
+        self.network.call('tidal', 'search')
+        kinds = {'Track': 'tracks', 'Album': 'albums', 'Artist': 'artists'}
+        wanted = [kinds[model.__name__] for model in models or []] or list(kinds.values())
+        results = {'tracks': [], 'albums': [], 'artists': [], 'videos': [], 'playlists': [], 'top_hit': None}
+        for kind in wanted:
+            results[kind] = self.library.search(kind, query, limit)
+        results['artists'] = [FakeArtist(self, artist) for artist in results['artists']]
+        return results
+
+    def get_tracks_by_isrc(self, isrc):
+        self.network.call('tidal', 'tracks_by_isrc')
+        if isrc not in self._isrc:
+            raise ObjectNotFound
+        # Like tidalapi, which fetches every hit with its own request
+        for _ in self._isrc[isrc]:
+            self.network.call('tidal', 'track')
+        return list(self._isrc[isrc])
+
+    def get_albums_by_barcode(self, barcode):
+        self.network.call('tidal', 'albums_by_barcode')
+        if barcode not in self._upc:
+            raise ObjectNotFound
+        self.network.call('tidal', 'album')
+        return [self._upc[barcode]]
+
+    def create_playlist(self, title, description, parent_id='root'):
+        self.network.call('tidal', 'create_playlist')
+        playlist = FakePlaylist(self, f'tp{len(self._playlists)}', title)
+        self._playlists[playlist.id] = playlist
+        return playlist
+
+    def playlists(self):
+        self.network.call('tidal', 'playlists')
+        return list(self._playlists.values())
+
+    def playlist(self, playlist_id):
+        self.network.call('tidal', 'playlist')
+        return self._playlists[playlist_id]
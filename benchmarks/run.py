@@ -0,0 +1,130 @@
+"""Benchmark the transfer engine against the in-process Spotify/Tidal fakes.
+
+    python -m benchmarks.run --size 10k
+    python -m benchmarks.run --size 1k --latency 0.02 --rate-limit 200 --error-rate 0.01 --json
+
+Reports items/sec, API calls per item, peak traced memory and match accuracy.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep the match cache and job store of benchmark runs away from the real ones
+os.environ['REPLAY_DATA_DIR'] = tempfile.mkdtemp(prefix='replay-bench-')
+
+from benchmarks.fakes import FakeSpotify, FakeTidal, Library, Network  # noqa: E402
+from replay.engine import ITEM, PLAN_READY, PLAYLIST, SECTIONS, TransferOptions, run_transfer  # noqa: E402
+from replay.jobs import JobStore  # noqa: E402
+from replay.metrics import Metrics  # noqa: E402
+
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+
+
+def run_once(library, network, sections, options, label):
+    sp = FakeSpotify(library, network)
+    tidal = FakeTidal(library, network)
+    job_store = JobStore(os.path.join(os.environ['REPLAY_DATA_DIR'], f'jobs-{label}.sqlite3'))
+
+    network.calls.clear()
+    metrics = Metrics()
+    items = 0
+    matched = correct = expected = false_matches = 0
+    planned = None
+    tracemalloc.start()
+    started = time.perf_counter()
+    for event in run_transfer(sp, tidal, sections, options, job_store=job_store, metrics=metrics):
+        if event['type'] == ITEM:
+            items += 1
+            truth = library.truth.get((event['section'], event['key']))
+            if truth is not None:
+                expected += 1
+            if event['tidal_id'] is not None:
+                matched += 1
+                correct += event['tidal_id'] == truth
+                false_matches += truth is None
+        elif event['type'] == PLAYLIST and event['state'] != 'running':
+            items += 1
+        elif event['type'] == PLAN_READY:
+            planned = event['report']['api_calls']['total']
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    calls = sum(network.calls.values())
+    endpoints = metrics.rows()
+    return {
+        'run': label,
+        'items': items,
+        'seconds': round(elapsed, 3),
+        'items_per_sec': round(items / elapsed, 1) if elapsed else None,
+        'api_calls': calls,
+        'api_calls_per_item': round(calls / max(items, 1), 3),
+        'planned_api_calls': planned,
+        'calls_by_endpoint': dict(network.calls.most_common()),
+        'retries': sum(row['retries'] for row in endpoints),
+        'backoff_seconds': round(sum(row['backoff_seconds'] for row in endpoints), 3),
+        'endpoints': endpoints,
+        'peak_memory_mb': round(peak / 2 ** 20, 1),
+        'accuracy': round(correct / max(expected, 1), 4),
+        'false_matches': false_matches,
+        'matched': matched,
+    }
+
+
+def _planned(total):
+    return f"{total['min']}-{total['max']}" if total else 'n/a'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=SIZES, default='1k', help="saved tracks in the synthetic library")
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--latency', type=float, default=0.005, help="simulated seconds per API call")
+    parser.add_argument('--rate-limit', type=int, default=None, help="calls/sec before the fakes answer 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of calls that drop the connection")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=10_000, help="client-side request limit per second")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--parallel-playlists', type=int, default=4)
+    parser.add_argument('--sync', action='store_true', help="benchmark sync mode")
+    parser.add_argument('--no-cache', action='store_true', help="do not keep matches between items or runs")
+    parser.add_argument('--plan', action='store_true', help="plan the whole transfer before resolving items")
+    parser.add_argument('--warm', action='store_true', help="run a second time to measure the match cache")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    library = Library(SIZES[args.size], seed=args.seed)
+    network = Network(latency=args.latency, rate_limit=args.rate_limit, error_rate=args.error_rate, seed=args.seed)
+    options = TransferOptions(max_workers=args.workers, requests_per_second=args.rate, chunk_size=args.batch_size,
+                              parallel_playlists=args.parallel_playlists, sync=args.sync,
+                              use_cache=not args.no_cache, plan=args.plan)
+
+    results = [run_once(library, network, args.sections, options, 'cold')]
+    if args.warm:
+        results.append(run_once(library, network, args.sections, options, 'warm'))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    for result in results:
+        print(f"[{args.size} {result['run']}] {result['items']} items in {result['seconds']}s "
+              f"({result['items_per_sec']} items/s), {result['api_calls']} API calls "
+              f"({result['api_calls_per_item']}/item; planned {_planned(result['planned_api_calls'])}), "
+              f"peak {result['peak_memory_mb']} MB, accuracy {result['accuracy']:.2%}, "
+              f"{result['false_matches']} false matches, {result['retries']} retries "
+              f"({result['backoff_seconds']}s backoff)")
+        for row in result['endpoints']:
+            print(f"    {row['phase']:<10} {row['endpoint']:<36} {row['calls']:>7} calls  "
+                  f"p50 {row['p50_seconds'] * 1000:7.1f}ms  p95 {row['p95_seconds'] * 1000:7.1f}ms  "
+                  f"{row['total_seconds']:8.2f}s total")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
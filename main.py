@@ -1,8 +1,50 @@
+import io
+
 import streamlit as st
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 import tidalapi.session
 
+from replay.batching import DEFAULT_CHUNK_SIZE, PLAYLIST_CHUNK_LIMIT
+from replay.cache import MatchCache
+from replay.clients import Clients
+from replay.concurrency import DEFAULT_RATE, DEFAULT_WORKERS
+from replay.credentials import spotify_oauth
+from replay.engine import (
+    ITEM,
+    PLAN_BUILDING,
+    PLAN_READY,
+    PLAYLIST,
+    SECTION_FETCHING,
+    SECTION_FINISHED,
+    SECTION_STARTED,
+    SKIPPED,
+    SYNC_LOADED,
+    SYNC_LOADING,
+    TransferOptions,
+    run_transfer,
+)
+from replay.jobs import EXISTING, FAILED, NOT_FOUND, WRITTEN, JobStore
+from replay.metrics import Metrics
+from replay.planner import summarize_report
+from replay.progress import ProgressTracker
+from replay.snapshot import export_library, read_snapshot
+from replay.sync import tidal_user_id
+
+RECENT_FAILURES = 5
+FAILURES_PAGE_SIZE = 50
+
+SECTION_TITLES = {
+    'tracks': "📀 Transferring Saved Tracks",
+    'albums': "💿 Transferring Saved Albums",
+    'artists': "👤 Transferring Followed Artists",
+    'playlists': "📝 Transferring Playlists",
+}
+SECTION_NOUNS = {
+    'tracks': "saved tracks",
+    'albums': "saved albums",
+    'artists': "followed artists",
+    'playlists': "playlists",
+}
+
 # Initialize session state
 if 'spotify_token' not in st.session_state:
     st.session_state.spotify_token = None
@@ -44,14 +86,8 @@ if not st.session_state.credentials_entered:
 if st.session_state.credentials_entered and st.session_state.spotify_token is None:
     
     # Set up Spotify OAuth
-    sp_oauth = SpotifyOAuth(
-        client_id=st.session_state.spotify_client_id,
-        client_secret=st.session_state.spotify_client_secret,
-        redirect_uri="https://iamreplay.streamlit.app/callback",
-        scope="user-library-read playlist-read-private playlist-read-collaborative user-follow-read",
-        cache_handler=None,
-        show_dialog=True
-    )
+    sp_oauth = spotify_oauth(st.session_state.spotify_client_id, st.session_state.spotify_client_secret,
+                             show_dialog=True)
     
     # If we have a code from OAuth callback, exchange it for a token
     if spotify_code:
@@ -138,9 +174,14 @@ if st.session_state.spotify_token and st.session_state.tidal_session:
             st.session_state.clear()
             st.rerun()
     
-    # Create clients
-    sp = spotipy.Spotify(auth=st.session_state.spotify_token['access_token'])
-    tidal = st.session_state.tidal_session
+    # Clients live as long as the login, so reruns reuse their connections and refreshed tokens
+    if 'clients' not in st.session_state:
+        spotify_auth = spotify_oauth(st.session_state.spotify_client_id, st.session_state.spotify_client_secret,
+                                     token_info=st.session_state.spotify_token)
+        st.session_state.clients = Clients(spotify_auth, st.session_state.tidal_session, DEFAULT_WORKERS)
+    clients = st.session_state.clients
+    sp = clients.sp
+    tidal = clients.tidal
     
     st.divider()
     st.subheader("Select content to transfer:")
@@ -153,266 +194,205 @@ if st.session_state.spotify_token and st.session_state.tidal_session:
         is_transfer_artists = st.checkbox("👤 Transfer Followed Artists")
         is_transfer_playlists = st.checkbox("📝 Transfer Playlists")
     
-    if st.button("🚀 Start Transfer", type="primary", use_container_width=True):
+    sync_mode = st.toggle("🔁 Sync mode: only transfer what is new or missing on Tidal",
+                          help="Skips favorites already on Tidal and reuses Tidal playlists with the same name")
+    
+    with st.expander("⚙️ Transfer settings"):
+        max_workers = st.slider("Parallel requests", min_value=1, max_value=32, value=DEFAULT_WORKERS)
+        requests_per_second = st.slider("Max Tidal requests per second", min_value=1.0, max_value=50.0,
+                                        value=DEFAULT_RATE)
+        write_batch_size = st.slider("Items per Tidal write", min_value=1, max_value=PLAYLIST_CHUNK_LIMIT,
+                                     value=DEFAULT_CHUNK_SIZE)
+        parallel_playlists = st.slider("Playlists transferred at once", min_value=1, max_value=8, value=2)
+        clients.resize(max_workers)
+        use_match_cache = st.checkbox("Reuse matches from previous transfers", value=True)
+        plan_first = st.checkbox("Plan before transferring", value=False,
+                                 help="Collects everything selected first, so songs saved and in several playlists "
+                                      "are looked up on Tidal only once; holds the whole library in memory "
+                                      "before matching starts")
+        if st.button("Clear match cache"):
+            MatchCache().clear()
+            st.success("✅ Match cache cleared")
+    
+    with st.expander("📦 Library snapshot"):
+        st.caption("Save your Spotify library to a file once, then transfer from it without reading Spotify again")
+        if st.button("Export library snapshot"):
+            with st.spinner("Reading your Spotify library..."):
+                snapshot_buffer = io.BytesIO()
+                export_library(sp, snapshot_buffer, parallel=parallel_playlists)
+                st.session_state.library_snapshot = snapshot_buffer.getvalue()
+        if st.session_state.get('library_snapshot'):
+            st.download_button("Download snapshot", st.session_state.library_snapshot,
+                               file_name="replay-library.ndjson.gz", mime="application/gzip")
+        snapshot_file = st.file_uploader("Transfer from a snapshot instead of Spotify", type=['gz'])
+    
+    # Look for a transfer that was interrupted by a rerun, disconnect or expired token
+    if 'spotify_user_id' not in st.session_state:
+        user_info = sp.me()
+        st.session_state.spotify_user_id = user_info.get('id') if isinstance(user_info, dict) else None
+    job_store = JobStore()
+    unfinished_job = job_store.latest_unfinished(st.session_state.spotify_user_id, tidal_user_id(tidal))
+    
+    resume = False
+    if unfinished_job is not None:
+        st.info(f"⏯️ A previous transfer ({', '.join(unfinished_job.sections)}) did not finish.")
+        col1, col2 = st.columns(2)
+        with col1:
+            resume = st.button("⏯️ Resume Transfer", use_container_width=True)
+        with col2:
+            if st.button("Discard", use_container_width=True):
+                unfinished_job.finish()
+                st.rerun()
+    
+    start = st.button("🚀 Start Transfer", type="primary", use_container_width=True)
+    dry_run = st.button("🔍 Dry Run: estimate the API calls without transferring", use_container_width=True)
+    if resume:
+        is_transfer_tracks = 'tracks' in unfinished_job.sections
+        is_transfer_albums = 'albums' in unfinished_job.sections
+        is_transfer_artists = 'artists' in unfinished_job.sections
+        is_transfer_playlists = 'playlists' in unfinished_job.sections
+    
+    if start or resume or dry_run:
         if not any([is_transfer_tracks, is_transfer_albums, is_transfer_artists, is_transfer_playlists]):
             st.warning("⚠️ Please select at least one content type to transfer.")
         else:
             try:
-                # Transfer Tracks
-                if is_transfer_tracks:
-                    st.subheader("📀 Transferring Saved Tracks")
-                    with st.spinner("Fetching your saved tracks from Spotify..."):
-                        all_tracks = []
-                        results = sp.current_user_saved_tracks(limit=50)
-                        all_tracks.extend(results['items'])
-                        
-                        while results['next']:
-                            results = sp.next(results)
-                            all_tracks.extend(results['items'])
-                        
-                        st.info(f"Found {len(all_tracks)} saved tracks")
+                options = TransferOptions(max_workers=max_workers, requests_per_second=requests_per_second,
+                                          chunk_size=write_batch_size, parallel_playlists=parallel_playlists,
+                                          use_cache=use_match_cache, sync=sync_mode, plan=plan_first,
+                                          dry_run=dry_run)
+                sections = [section for section, selected in [('tracks', is_transfer_tracks),
+                                                              ('albums', is_transfer_albums),
+                                                              ('artists', is_transfer_artists),
+                                                              ('playlists', is_transfer_playlists)]
+                            if selected]
+                metrics = Metrics()
+                st.session_state.last_metrics = metrics
+                snapshot = read_snapshot(snapshot_file) if snapshot_file is not None else None
+                events = run_transfer(sp, tidal, sections, options, job_store=job_store,
+                                      job=unfinished_job if resume else None,
+                                      user_id=st.session_state.spotify_user_id, metrics=metrics,
+                                      snapshot=snapshot)
+                
+                tracker = ProgressTracker()
+                dirty_playlists = set()
+                for event in events:
+                    tracker.update(event)
+                    kind = event['type']
+                    section = event.get('section')
                     
-                    progress_bar = st.progress(0)
-                    success_count = 0
-                    fail_count = 0
+                    if kind == SYNC_LOADING:
+                        status = st.empty()
+                        status.info("Loading your Tidal library...")
                     
-                    for idx, item in enumerate(all_tracks):
-                        if not isinstance(item, dict):
-                            continue
-                        
-                        track = item.get('track')
-                        if not track or not isinstance(track, dict):
-                            continue
-                        
-                        track_name = track.get('name', 'Unknown Track')
-                        artists = track.get('artists')
-                        
-                        artist_name = 'Unknown Artist'
-                        if artists and isinstance(artists, list) and len(artists) > 0:
-                            first_artist = artists[0]
-                            if isinstance(first_artist, dict):
-                                artist_name = first_artist.get('name', 'Unknown Artist')
-                        
-                        try:
-                            # Search on Tidal
-                            search_results = tidal.search(f"{artist_name} {track_name}")
-                            if search_results and isinstance(search_results, dict):
-                                tracks_list = search_results.get('tracks')
-                                if tracks_list and isinstance(tracks_list, list) and len(tracks_list) > 0:
-                                    tidal_track = tracks_list[0]
-                                    tidal.user.favorites.add_track(tidal_track.id)
-                                    st.write(f"✓ Added: {track_name} by {artist_name}")
-                                    success_count += 1
-                                else:
-                                    st.write(f"✗ Not found: {track_name} by {artist_name}")
-                                    fail_count += 1
-                            else:
-                                st.write(f"✗ Not found: {track_name} by {artist_name}")
-                                fail_count += 1
-                        except Exception as e:
-                            st.write(f"✗ Error with: {track_name} - {str(e)}")
-                            fail_count += 1
-                        
-                        progress_bar.progress((idx + 1) / len(all_tracks))
+                    elif kind == SYNC_LOADED:
+                        existing = event['existing']
+                        status.info(f"Tidal already has {existing['tracks']} tracks, {existing['albums']} albums, "
+                                    f"{existing['artists']} artists and {event['playlists']} playlists")
                     
-                    st.success(f"✅ Tracks: {success_count} added, {fail_count} failed")
-                
-                # Transfer Albums
-                if is_transfer_albums:
-                    st.subheader("💿 Transferring Saved Albums")
-                    with st.spinner("Fetching your saved albums from Spotify..."):
-                        all_albums = []
-                        results = sp.current_user_saved_albums(limit=50)
-                        all_albums.extend(results['items'])
-                        
-                        while results['next']:
-                            results = sp.next(results)
-                            all_albums.extend(results['items'])
-                        
-                        st.info(f"Found {len(all_albums)} saved albums")
+                    elif kind == PLAN_BUILDING:
+                        st.subheader("🗺️ Planning the transfer")
+                        status = st.empty()
+                        status.info("Collecting everything selected from Spotify...")
                     
-                    progress_bar = st.progress(0)
-                    success_count = 0
-                    fail_count = 0
+                    elif kind == PLAN_READY:
+                        status.info(summarize_report(event['report']))
+                        if event['dry_run']:
+                            st.json(event['report'])
                     
-                    for idx, item in enumerate(all_albums):
-                        if not isinstance(item, dict):
-                            continue
-                        
-                        album = item.get('album')
-                        if not album or not isinstance(album, dict):
-                            continue
-                        
-                        album_name = album.get('name', 'Unknown Album')
-                        artists = album.get('artists')
-                        
-                        artist_name = 'Unknown Artist'
-                        if artists and isinstance(artists, list) and len(artists) > 0:
-                            first_artist = artists[0]
-                            if isinstance(first_artist, dict):
-                                artist_name = first_artist.get('name', 'Unknown Artist')
-                        
-                        try:
-                            search_results = tidal.search(f"{artist_name} {album_name}")
-                            if search_results and isinstance(search_results, dict):
-                                albums_list = search_results.get('albums')
-                                if albums_list and isinstance(albums_list, list) and len(albums_list) > 0:
-                                    tidal_album = albums_list[0]
-                                    tidal.user.favorites.add_album(tidal_album.id)
-                                    st.write(f"✓ Added: {album_name} by {artist_name}")
-                                    success_count += 1
-                                else:
-                                    st.write(f"✗ Not found: {album_name} by {artist_name}")
-                                    fail_count += 1
-                            else:
-                                st.write(f"✗ Not found: {album_name} by {artist_name}")
-                                fail_count += 1
-                        except Exception as e:
-                            st.write(f"✗ Error with: {album_name} - {str(e)}")
-                            fail_count += 1
-                        
-                        progress_bar.progress((idx + 1) / len(all_albums))
+                    elif kind == SECTION_FETCHING:
+                        st.subheader(SECTION_TITLES[section])
+                        status = st.empty()
+                        status.info(f"Fetching your {SECTION_NOUNS[section]} from Spotify...")
                     
-                    st.success(f"✅ Albums: {success_count} added, {fail_count} failed")
-                
-                # Transfer Artists
-                if is_transfer_artists:
-                    st.subheader("👤 Transferring Followed Artists")
-                    with st.spinner("Fetching your followed artists from Spotify..."):
-                        all_artists = []
-                        results = sp.current_user_followed_artists(limit=50)
-                        all_artists.extend(results['artists']['items'])
-                        
-                        while results['artists']['next']:
-                            results = sp.next(results['artists'])
-                            all_artists.extend(results['artists']['items'])
-                        
-                        st.info(f"Found {len(all_artists)} followed artists")
+                    elif kind == SECTION_STARTED:
+                        status.info(f"Found {event['total']} {SECTION_NOUNS[section]}")
+                        if event['already_done']:
+                            st.info(f"Resuming: {event['already_done']} already transferred")
+                        progress_bar = st.progress(0)
+                        stats = st.empty()
+                        if section == 'playlists':
+                            playlist_bars = {}
+                            for playlist in event['playlists']:
+                                playlist_bars[playlist['id']] = st.progress(
+                                    0, text=f"📝 Creating playlist: {playlist['name']}")
+                        recent_failures = st.empty()
                     
-                    progress_bar = st.progress(0)
-                    success_count = 0
-                    fail_count = 0
+                    elif kind == PLAYLIST:
+                        dirty_playlists.add(event['id'])
                     
-                    for idx, artist in enumerate(all_artists):
-                        if not artist or not isinstance(artist, dict):
-                            continue
-                        
-                        artist_name = artist.get('name', 'Unknown Artist')
+                    # Redraw a few times per second rather than once per item
+                    if kind in (ITEM, PLAYLIST, SECTION_FINISHED) and tracker.due(force=kind == SECTION_FINISHED):
+                        with metrics.measure('streamlit.render'):
+                            progress = tracker.sections[section]
+                            progress_bar.progress(progress.fraction)
+                            stats.caption(progress.summary())
+                            failures = [failure for failure in tracker.failures if failure['section'] == section]
+                            if failures:
+                                recent_failures.dataframe(failures[-RECENT_FAILURES:], hide_index=True,
+                                                          use_container_width=True)
                         
-                        try:
-                            search_results = tidal.search(artist_name)
-                            if search_results and isinstance(search_results, dict):
-                                artists_list = search_results.get('artists')
-                                if artists_list and isinstance(artists_list, list) and len(artists_list) > 0:
-                                    tidal_artist = artists_list[0]
-                                    tidal.user.favorites.add_artist(tidal_artist.id)
-                                    st.write(f"✓ Added: {artist_name}")
-                                    success_count += 1
+                            for playlist_id in dirty_playlists:
+                                playlist = tracker.playlists[playlist_id]
+                                playlist_bar = playlist_bars[playlist_id]
+                                name = playlist['name']
+                                if playlist['state'] == 'running':
+                                    playlist_bar.progress(min(playlist['done'] / max(playlist['total'], 1), 1.0),
+                                                          text=f"📝 {name} ({playlist['done']}/{playlist['total']})")
+                                elif playlist['state'] == SKIPPED:
+                                    playlist_bar.progress(1.0, text=f"✓ Already transferred: {name}")
+                                elif playlist['state'] == FAILED:
+                                    playlist_bar.progress(1.0,
+                                                          text=f"✗ Failed to create: {name} - {playlist['error']}")
+                                elif playlist['added']:
+                                    playlist_bar.progress(1.0, text=f"✓ Created: {name} ({playlist['added']} tracks)")
                                 else:
-                                    st.write(f"✗ Not found: {artist_name}")
-                                    fail_count += 1
-                            else:
-                                st.write(f"✗ Not found: {artist_name}")
-                                fail_count += 1
-                        except Exception as e:
-                            st.write(f"✗ Error with: {artist_name} - {str(e)}")
-                            fail_count += 1
-                        
-                        progress_bar.progress((idx + 1) / len(all_artists))
+                                    playlist_bar.progress(1.0, text=f"⚠️ Created: {name} (no tracks found)")
+                            dirty_playlists.clear()
                     
-                    st.success(f"✅ Artists: {success_count} added, {fail_count} failed")
+                    if kind == SECTION_FINISHED:
+                        counts = event['counts']
+                        if section == 'playlists':
+                            st.success("✅ Playlists transfer complete!")
+                        else:
+                            st.success(f"✅ {section.capitalize()}: {counts.get(WRITTEN, 0)} added, "
+                                       f"{counts.get(EXISTING, 0)} already in Tidal, "
+                                       f"{counts.get(NOT_FOUND, 0)} not found, {counts.get(FAILED, 0)} failed")
                 
-                # Transfer Playlists
-                if is_transfer_playlists:
-                    st.subheader("📝 Transferring Playlists")
-                    with st.spinner("Fetching your playlists from Spotify..."):
-                        playlists = sp.current_user_playlists(limit=50)
-                        user_info = sp.me()
-                        user_id = None
-                        if user_info and isinstance(user_info, dict):
-                            user_id = user_info.get('id')
-                        st.info(f"Found {len(playlists['items'])} playlists")
-                    
-                    for playlist in playlists['items']:
-                        if not playlist or not isinstance(playlist, dict):
-                            continue
-                        
-                        owner = playlist.get('owner')
-                        if not owner or not isinstance(owner, dict):
-                            continue
-                        
-                        if owner.get('id') != user_id:
-                            continue
-                        
-                        playlist_name = playlist.get('name', 'Unnamed Playlist')
-                        playlist_id = playlist.get('id')
-                        st.write(f"📝 Creating playlist: {playlist_name}")
-                        
-                        try:
-                            # Create playlist on Tidal
-                            new_playlist = tidal.user.create_playlist(playlist_name, "")
-                            
-                            # Get tracks from Spotify playlist
-                            if not playlist_id:
-                                continue
-                            
-                            tracks_results = sp.playlist_tracks(playlist_id)
-                            track_ids = []
-                            
-                            if not tracks_results or not isinstance(tracks_results, dict):
-                                continue
-                            
-                            items_list = tracks_results.get('items')
-                            if not items_list or not isinstance(items_list, list):
-                                continue
-                            
-                            for item in items_list:
-                                if not item or not isinstance(item, dict):
-                                    continue
-                                
-                                track = item.get('track')
-                                if not track or not isinstance(track, dict):
-                                    continue
-                                
-                                track_name = track.get('name', '')
-                                artists = track.get('artists')
-                                
-                                if not artists or not isinstance(artists, list) or len(artists) == 0:
-                                    continue
-                                
-                                first_artist = artists[0]
-                                if not isinstance(first_artist, dict):
-                                    continue
-                                
-                                artist_name = first_artist.get('name', '')
-                                if not artist_name:
-                                    continue
-                                
-                                try:
-                                    search_results = tidal.search(f"{artist_name} {track_name}")
-                                    if not search_results or not isinstance(search_results, dict):
-                                        continue
-                                    
-                                    tracks_list = search_results.get('tracks')
-                                    if tracks_list and isinstance(tracks_list, list) and len(tracks_list) > 0:
-                                        track_ids.append(tracks_list[0].id)
-                                except:
-                                    pass
-                            
-                            # Add tracks to Tidal playlist
-                            if track_ids:
-                                new_playlist.add(track_ids)
-                                st.write(f"✓ Created: {playlist_name} ({len(track_ids)} tracks)")
-                            else:
-                                st.write(f"⚠️ Created: {playlist_name} (no tracks found)")
-                        except Exception as e:
-                            st.write(f"✗ Failed to create: {playlist_name} - {str(e)}")
-                    
-                    st.success("✅ Playlists transfer complete!")
-                
-                st.balloons()
-                st.success("🎉 Transfer complete!")
+                if dry_run:
+                    st.success("✅ Dry run complete: nothing was written to Tidal")
+                else:
+                    st.session_state.last_failures = tracker.failures
+                    st.balloons()
+                    st.success("🎉 Transfer complete!")
                 
             except Exception as e:
                 st.error(f"Transfer error: {str(e)}")
                 st.exception(e)
+    
+    # Failures from the last transfer stay browsable across reruns
+    if st.session_state.get('last_failures'):
+        failures = st.session_state.last_failures
+        with st.expander(f"⚠️ {len(failures)} items were not transferred"):
+            page_count = (len(failures) - 1) // FAILURES_PAGE_SIZE + 1
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1)
+            st.dataframe(failures[(page - 1) * FAILURES_PAGE_SIZE:page * FAILURES_PAGE_SIZE],
+                         hide_index=True, use_container_width=True)
+    
+    # Where the time of the last transfer went, per API endpoint and phase
+    if st.session_state.get('last_metrics'):
+        metrics = st.session_state.last_metrics
+        with st.expander("🩺 Diagnostics"):
+            rows = metrics.rows()
+            phases = sorted({row['phase'] for row in rows})
+            phase = st.selectbox("Phase", ["All"] + phases)
+            st.dataframe([{key: value for key, value in row.items() if key != 'buckets'}
+                          for row in rows if phase == "All" or row['phase'] == phase],
+                         hide_index=True, use_container_width=True)
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("Download JSON", metrics.to_json(indent=2), file_name="replay-metrics.json",
+                                   mime="application/json", use_container_width=True)
+            with col2:
+                st.download_button("Download Prometheus", metrics.to_prometheus(), file_name="replay-metrics.prom",
+                                   mime="text/plain", use_container_width=True)
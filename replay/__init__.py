@@ -0,0 +1 @@
+"""Transfer engine for Replay, the Spotify to Tidal library transfer app."""
@@ -0,0 +1,56 @@
+"""Collect resolved Tidal IDs and write them in bulk."""
+
+DEFAULT_CHUNK_SIZE = 50
+# Tidal rejects playlist appends with more than this many items
+PLAYLIST_CHUNK_LIMIT = 100
+DEFAULT_CHUNK_RETRIES = 2
+
+
+class WriteError(Exception):
+    pass
+
+
+class WriteBatcher:
+    """Buffers `(tidal_id, item)` pairs and flushes them with one `write(ids)` call per chunk.
+
+    `add` and `flush` return `(item, error)` pairs for every item in the chunks they
+    wrote, with `error` set to None on success. A failed chunk is retried on its own
+    before its items are reported as failed, and chunks are written in the order
+    they were filled, so playlist order is kept.
+    """
+
+    def __init__(self, pool, write, chunk_size=DEFAULT_CHUNK_SIZE, retries=DEFAULT_CHUNK_RETRIES):
+        self.pool = pool
+        self.write = write
+        self.chunk_size = max(1, int(chunk_size))
+        self.retries = retries
+        self.calls = 0
+        self._pending = []
+
+    def add(self, tidal_id, item=None):
+        self._pending.append((tidal_id, item))
+        if len(self._pending) >= self.chunk_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        outcomes = []
+        while self._pending:
+            chunk = self._pending[:self.chunk_size]
+            del self._pending[:self.chunk_size]
+            error = self._write_chunk([tidal_id for tidal_id, _ in chunk])
+            outcomes.extend((item, error) for _, item in chunk)
+        return outcomes
+
+    def _write_chunk(self, ids):
+        error = None
+        for _ in range(self.retries + 1):
+            self.calls += 1
+            try:
+                if self.pool.call(self.write, ids) is False:
+                    error = WriteError(f"Tidal rejected a batch of {len(ids)} items")
+                    continue
+                return None
+            except Exception as e:
+                error = e
+        return error
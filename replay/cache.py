@@ -0,0 +1,164 @@
+"""On-disk cache of Spotify -> Tidal matches."""
+
+import os
+import sqlite3
+import threading
+import time
+
+from replay.concurrency import Memo
+
+DATA_DIR = os.environ.get('REPLAY_DATA_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'replay'))
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, 'matches.sqlite3')
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 200_000
+
+# Returned by `MatchCache.get` when nothing usable is cached; `None` means "cached as not found"
+MISS = object()
+
+
+def cache_keys(entity, external_id=None):
+    """Build the lookup keys for a Spotify object: its Spotify ID plus ISRC/UPC when present."""
+    keys = []
+    if not isinstance(entity, dict):
+        return keys
+    if entity.get('id'):
+        keys.append(f"spotify:{entity['id']}")
+    external_ids = entity.get('external_ids')
+    if external_id and isinstance(external_ids, dict) and external_ids.get(external_id):
+        keys.append(f"{external_id}:{str(external_ids[external_id]).upper()}")
+    return keys
+
+
+class MatchCache:
+    """SQLite-backed map of `(kind, key)` to Tidal IDs with TTL and LRU eviction.
+
+    Misses are cached too (with a shorter TTL) so items Tidal does not carry are
+    not searched again on every run. Safe to share between worker threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS matches ('
+            ' kind TEXT NOT NULL, key TEXT NOT NULL, tidal_id TEXT,'
+            ' created REAL NOT NULL, last_used REAL NOT NULL,'
+            ' PRIMARY KEY (kind, key))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS matches_last_used ON matches (last_used)')
+        # Runs rarely reach the periodic eviction in `put`, so the cap is also applied on open
+        self._evict()
+
+    def get(self, kind, keys):
+        """Return the cached Tidal ID for the first fresh key, `None` for a cached miss, or `MISS`."""
+        if not keys:
+            return MISS
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    'SELECT tidal_id, created FROM matches WHERE kind = ? AND key = ?', (kind, key)
+                ).fetchone()
+                if row is None:
+                    continue
+                tidal_id, created = row
+                ttl = self.ttl if tidal_id is not None else self.negative_ttl
+                if now - created > ttl:
+                    self._conn.execute('DELETE FROM matches WHERE kind = ? AND key = ?', (kind, key))
+                    continue
+                self._conn.execute(
+                    'UPDATE matches SET last_used = ? WHERE kind = ? AND key = ?', (now, kind, key)
+                )
+                return tidal_id
+        return MISS
+
+    def put(self, kind, keys, tidal_id):
+        """Record a match (or a miss, with `tidal_id=None`) under every key."""
+        if not keys:
+            return
+        now = time.time()
+        tidal_id = str(tidal_id) if tidal_id is not None else None
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO matches (kind, key, tidal_id, created, last_used) VALUES (?, ?, ?, ?, ?)',
+                [(kind, key, tidal_id, now, now) for key in keys],
+            )
+            self._puts += 1
+            if self._puts % 1000 == 0:
+                self._evict()
+
+    def resolve(self, kind, keys, compute):
+        """Return the cached Tidal ID, or compute it with `compute()` and cache the result."""
+        tidal_id = self.get(kind, keys)
+        if tidal_id is MISS:
+            tidal_id = compute()
+            self.put(kind, keys, tidal_id)
+        return tidal_id
+
+    def _evict(self):
+        count = self._conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM matches WHERE rowid IN (SELECT rowid FROM matches ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM matches')
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self._conn.close()
+
+
+class RunCache:
+    """In-memory layer over an optional `MatchCache`, for the length of one transfer.
+
+    An entity that several sections hold, or the same recording under another
+    Spotify ID with the same ISRC, is resolved once; concurrent requests for it
+    wait for the first instead of searching Tidal again.
+    """
+
+    def __init__(self, backing=None):
+        self.backing = backing
+        self._memo = Memo()
+
+    def lookup(self, kind, keys):
+        """Return what is already known for `keys` without resolving anything, or `MISS`."""
+        for key in keys:
+            tidal_id = self._memo.peek((kind, key), MISS)
+            if tidal_id is not MISS:
+                return tidal_id
+        return self.backing.get(kind, keys) if self.backing is not None else MISS
+
+    def resolve(self, kind, keys, compute):
+        if not keys:
+            return compute()
+        for key in keys[1:]:
+            tidal_id = self._memo.peek((kind, key), MISS)
+            if tidal_id is not MISS:
+                return tidal_id
+
+        def load():
+            tidal_id = self.backing.resolve(kind, keys, compute) if self.backing is not None else compute()
+            for key in keys[1:]:
+                self._memo.put((kind, key), tidal_id)
+            return tidal_id
+        return self._memo.get((kind, keys[0]), load)
@@ -0,0 +1,70 @@
+"""In-memory index of Tidal artist catalogs, shared by every worker of a transfer.
+
+Searching Tidal once per track costs one request per track. When many saved
+tracks share an artist, it is cheaper to resolve the artist once, list its
+releases once, and match each track against the tracks of its own album.
+"""
+
+import threading
+from collections import Counter
+
+from replay.concurrency import Memo
+from replay.matching import album_scorer, best_candidate, find_artist
+
+# Lookups of one artist before its catalog is fetched; rarer artists are searched track by track
+CATALOG_THRESHOLD = 3
+# Releases listed per artist, of albums and of EPs/singles each
+RELEASES_LIMIT = 100
+
+
+class ArtistCatalog:
+    """Memoizes artist → Tidal artist, artist → releases and release → tracks for one run.
+
+    Each of them is fetched once even when several workers ask at the same time.
+    """
+
+    def __init__(self, threshold=CATALOG_THRESHOLD):
+        self.threshold = threshold
+        self._seen = Counter()
+        self._artists = Memo()
+        self._releases = Memo()
+        self._tracks = Memo()
+        self._lock = threading.Lock()
+
+    def _artist(self, pool, tidal, spotify_artist):
+        key = spotify_artist.get('id') or spotify_artist.get('name')
+        return self._artists.get(key, lambda: find_artist(pool, tidal, spotify_artist))
+
+    def _artist_releases(self, pool, tidal_artist, fetch):
+        return self._releases.get((tidal_artist.id, fetch),
+                                  lambda: list(pool.call(getattr(tidal_artist, fetch), limit=RELEASES_LIMIT) or []))
+
+    def _release_tracks(self, pool, release):
+        return self._tracks.get(release.id, lambda: list(pool.call(release.tracks) or []))
+
+    def candidates(self, pool, tidal, track):
+        """Tidal tracks that may match `track`, from its primary artist's catalog.
+
+        Returns nothing until the artist has been looked up `threshold` times, or if
+        the artist or the track's album cannot be found on Tidal.
+        """
+        artists = [artist for artist in track.get('artists') or [] if isinstance(artist, dict)]
+        album = track.get('album')
+        if not artists or not isinstance(album, dict):
+            return []
+        key = artists[0].get('id') or artists[0].get('name')
+        with self._lock:
+            self._seen[key] += 1
+            if self._seen[key] < self.threshold:
+                return []
+
+        tidal_artist = self._artist(pool, tidal, artists[0])
+        if tidal_artist is None:
+            return []
+        score = album_scorer(album)
+        # Singles and EPs are only listed for tracks that none of the albums hold
+        release = (best_candidate(self._artist_releases(pool, tidal_artist, 'get_albums'), score)
+                   or best_candidate(self._artist_releases(pool, tidal_artist, 'get_ep_singles'), score))
+        if release is None:
+            return []
+        return self._release_tracks(pool, release)
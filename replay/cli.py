@@ -0,0 +1,261 @@
+"""Command line entry point for unattended transfers."""
+
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tidalapi.session
+
+from replay.batching import DEFAULT_CHUNK_SIZE, PLAYLIST_CHUNK_LIMIT
+from replay.concurrency import DEFAULT_RATE, DEFAULT_WORKERS
+from replay.credentials import (
+    dump_credentials,
+    load_credentials,
+    save_credentials,
+    spotify_client,
+    spotify_oauth,
+    tidal_credentials,
+    tidal_session,
+)
+from replay.engine import (
+    ITEM,
+    JOB_FINISHED,
+    JOB_STARTED,
+    PLAN_READY,
+    PLAYLIST,
+    SECTION_FINISHED,
+    SECTION_STARTED,
+    SECTIONS,
+    TransferOptions,
+    run_transfer,
+)
+from replay.jobs import FAILED, JobStore
+from replay.metrics import Metrics
+from replay.planner import summarize_report
+from replay.progress import ProgressTracker
+from replay.snapshot import export_library, read_snapshot
+from replay.sync import tidal_user_id
+
+# Seconds between status lines in plain-text output
+STATUS_INTERVAL = 5.0
+
+_print_lock = threading.Lock()
+
+
+def emit(line):
+    with _print_lock:
+        print(line, flush=True)
+
+
+def format_event(event):
+    """Render the events worth a line in plain-text output; returns None for the rest."""
+    prefix = f"[{event['account']}] " if event.get('account') else ''
+    kind = event['type']
+    if kind == JOB_STARTED:
+        return f"{prefix}Job {event['job_id']}: {', '.join(event['sections'])}"
+    if kind == PLAN_READY:
+        return f"{prefix}Plan: {summarize_report(event['report'])}"
+    if kind == SECTION_STARTED:
+        return f"{prefix}{event['section']}: {event['total']} found, {event['already_done']} already done"
+    if kind == ITEM and event['state'] == FAILED:
+        return f"{prefix}✗ Error with: {event['name']} - {event['error']}"
+    if kind == PLAYLIST and event['state'] == FAILED:
+        return f"{prefix}✗ Failed to create: {event['name']} - {event['error']}"
+    if kind == SECTION_FINISHED:
+        counts = ', '.join(f"{count} {state}" for state, count in sorted(event['counts'].items()))
+        return f"{prefix}{event['section']}: {counts or 'nothing to do'}"
+    if kind == JOB_FINISHED:
+        return f"{prefix}Job {event['job_id']} complete"
+    return None
+
+
+def write_metrics(path, metrics):
+    """Export API call metrics: Prometheus text for `.prom`/`.txt` paths, JSON otherwise."""
+    with open(path, 'w') as f:
+        if path.endswith(('.prom', '.txt')):
+            f.write(metrics.to_prometheus())
+        else:
+            f.write(metrics.to_json(indent=2))
+
+
+def transfer_account(credentials_path, sections, options, resume=False, ndjson=False, account=None,
+                     metrics=None, snapshot_path=None):
+    """Run one account's transfer, printing its events. Returns True if nothing failed.
+
+    With a `snapshot_path`, the library is read from that snapshot instead of Spotify.
+    """
+    credentials = load_credentials(credentials_path)
+    sp = spotify_client(credentials, options.max_workers)
+    tidal = tidal_session(credentials, options.max_workers)
+    job_store = JobStore()
+
+    snapshot = read_snapshot(snapshot_path) if snapshot_path else None
+    if snapshot is not None:
+        user_id = snapshot.user_id
+    else:
+        user_info = sp.me()
+        user_id = user_info.get('id') if isinstance(user_info, dict) else None
+    job = job_store.latest_unfinished(user_id, tidal_user_id(tidal)) if resume else None
+
+    ok = True
+    tracker = ProgressTracker(interval=STATUS_INTERVAL)
+    try:
+        for event in run_transfer(sp, tidal, sections, options, job_store=job_store, job=job, user_id=user_id,
+                                  metrics=metrics, snapshot=snapshot):
+            if account:
+                event['account'] = account
+            if event['type'] in (ITEM, PLAYLIST) and event['state'] == FAILED:
+                ok = False
+            line = json.dumps(event) if ndjson else format_event(event)
+            if line is not None:
+                emit(line)
+            tracker.update(event)
+            if not ndjson and event['type'] in (ITEM, PLAYLIST) and tracker.due():
+                prefix = f"[{account}] " if account else ''
+                emit(f"{prefix}{event['section']}: {tracker.sections[event['section']].summary()}")
+    finally:
+        # Both clients may have refreshed their tokens during a long run
+        save_credentials(credentials_path, dump_credentials(sp, tidal))
+    return ok
+
+
+def add_transfer_options(parser):
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS),
+                        help="what to transfer (default: everything)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="parallel requests")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="max Tidal requests per second")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"items per Tidal write (max {PLAYLIST_CHUNK_LIMIT} for playlists)")
+    parser.add_argument('--parallel-playlists', type=int, default=2, help="playlists transferred at once")
+    parser.add_argument('--no-cache', action='store_true', help="do not reuse matches from earlier runs")
+    parser.add_argument('--sync', action='store_true', help="only transfer what is missing on Tidal")
+    parser.add_argument('--plan', action='store_true',
+                        help="collect and deduplicate the whole transfer before resolving anything, "
+                             "instead of resolving items as they are fetched")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="only plan the transfer and report the API calls it would take")
+    parser.add_argument('--resume', action='store_true', help="resume the account's unfinished job, if any")
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help="transfer the library stored by `replay export` instead of reading Spotify")
+    parser.add_argument('--ndjson', action='store_true', help="print every progress event as a JSON line")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="write API call metrics here: Prometheus text for .prom files, JSON otherwise")
+
+
+def options_from_args(args):
+    return TransferOptions(max_workers=args.workers, requests_per_second=args.rate, chunk_size=args.batch_size,
+                           parallel_playlists=args.parallel_playlists, use_cache=not args.no_cache,
+                           sync=args.sync, plan=args.plan, dry_run=args.dry_run)
+
+
+def cmd_login(args):
+    oauth = spotify_oauth(args.spotify_client_id, args.spotify_client_secret, open_browser=False)
+    print("Authorize Spotify, then paste the URL you are redirected to.")
+    code = oauth.get_auth_response()
+    token_info = oauth.get_access_token(code, check_cache=False)
+
+    tidal = tidalapi.session.Session()
+    tidal.login_oauth_simple(fn_print=print)
+
+    credentials = {
+        'spotify': {'client_id': args.spotify_client_id, 'client_secret': args.spotify_client_secret,
+                    'token_info': token_info},
+        'tidal': tidal_credentials(tidal),
+    }
+    save_credentials(args.output, credentials)
+    print(f"Saved credentials to {args.output}")
+    return 0
+
+
+def cmd_export(args):
+    credentials = load_credentials(args.credentials)
+    sp = spotify_client(credentials)
+    try:
+        snapshot = export_library(sp, args.output, args.sections)
+    finally:
+        # Spotify may have refreshed its token; Tidal was not used
+        credentials['spotify']['token_info'] = sp.auth_manager.cache_handler.get_cached_token()
+        save_credentials(args.credentials, credentials)
+    plan = snapshot.plan
+    counts = ', '.join(f"{len(plan.saved[section])} saved {section}" for section in plan.saved)
+    tracks = sum(len(listing) for listing in plan.playlist_tracks.values())
+    print(f"Exported {counts or 'no saved items'} and {len(plan.playlists)} playlists ({tracks} tracks) "
+          f"to {args.output}")
+    return 0
+
+
+def cmd_transfer(args):
+    metrics = Metrics() if args.metrics else None
+    try:
+        ok = transfer_account(args.credentials, args.sections, options_from_args(args), resume=args.resume,
+                              ndjson=args.ndjson, metrics=metrics, snapshot_path=args.snapshot)
+    finally:
+        if metrics is not None:
+            write_metrics(args.metrics, metrics)
+    return 0 if ok else 1
+
+
+def cmd_batch(args):
+    with open(args.accounts) as f:
+        accounts = json.load(f)
+    options = options_from_args(args)
+    # One per account, since each account's engine tracks its own phase; merged for the export
+    account_metrics = [Metrics() if args.metrics else None for _ in accounts]
+
+    def run(account, metrics):
+        name = account.get('name') or account['credentials']
+        try:
+            return transfer_account(account['credentials'], account.get('sections') or args.sections, options,
+                                    resume=args.resume, ndjson=args.ndjson, account=name, metrics=metrics,
+                                    snapshot_path=account.get('snapshot') or args.snapshot)
+        except Exception as e:
+            emit(json.dumps({'type': 'error', 'account': name, 'error': str(e)}) if args.ndjson
+                 else f"[{name}] ✗ Transfer error: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel_accounts)) as executor:
+        results = list(executor.map(run, accounts, account_metrics))
+    if args.metrics:
+        metrics = Metrics()
+        for each in account_metrics:
+            metrics.merge(each)
+        write_metrics(args.metrics, metrics)
+    return 0 if all(results) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='replay', description="Transfer a Spotify library to Tidal.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    login = commands.add_parser('login', help="authorize Spotify and Tidal and store the tokens")
+    login.add_argument('--spotify-client-id', required=True)
+    login.add_argument('--spotify-client-secret', required=True)
+    login.add_argument('--output', default='replay-credentials.json')
+    login.set_defaults(func=cmd_login)
+
+    export = commands.add_parser('export', help="save the Spotify library to a snapshot file")
+    export.add_argument('credentials', help="credentials file written by `replay login`")
+    export.add_argument('output', help="snapshot to write, gzipped NDJSON, e.g. library.ndjson.gz")
+    export.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS),
+                        help="what to export (default: everything)")
+    export.set_defaults(func=cmd_export)
+
+    transfer = commands.add_parser('transfer', help="transfer one account using stored tokens")
+    transfer.add_argument('credentials', help="credentials file written by `replay login`")
+    add_transfer_options(transfer)
+    transfer.set_defaults(func=cmd_transfer)
+
+    batch = commands.add_parser('batch', help="transfer many accounts from a JSON list")
+    batch.add_argument('accounts', help='JSON list of {"name", "credentials", "sections", "snapshot"} objects')
+    batch.add_argument('--parallel-accounts', type=int, default=1, help="accounts transferred at once")
+    add_transfer_options(batch)
+    batch.set_defaults(func=cmd_batch)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
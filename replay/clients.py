@@ -0,0 +1,155 @@
+"""Long-lived Spotify and Tidal clients with pooled connections and self-refreshing tokens.
+
+One set of clients serves a whole session: every worker thread shares their
+keep-alive connections, and tokens are refreshed ahead of expiry, once, under a
+lock, so multi-hour transfers outlive the one-hour access tokens.
+"""
+
+import datetime
+import threading
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.oauth2 import SpotifyOAuth
+from urllib3.util.retry import Retry
+
+# Connections kept open beyond one per worker, for the playlist and feeder threads
+POOL_HEADROOM = 4
+# Distinct hosts each client keeps a pool for, e.g. api.tidal.com and auth.tidal.com
+POOL_HOSTS = 4
+# Refresh Tidal tokens this long before they expire
+TIDAL_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+def pool_size(max_workers):
+    return max(1, int(max_workers)) + POOL_HEADROOM
+
+
+def mount_pool(session, size, max_retries=0):
+    """Give `session` keep-alive connection pools that fit `size` concurrent requests."""
+    previous = set(session.adapters.values())
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=size, max_retries=max_retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    for old in previous - set(session.adapters.values()):
+        old.close()
+    return session
+
+
+def _spotify_retry():
+    # The retry policy spotipy mounts on the sessions it builds itself
+    return Retry(total=spotipy.Spotify.max_retries, connect=None, read=False,
+                 allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                 status=spotipy.Spotify.max_retries, backoff_factor=0.3,
+                 status_forcelist=spotipy.Spotify.default_retry_codes)
+
+
+class SharedSpotifyOAuth(SpotifyOAuth):
+    """A `SpotifyOAuth` that worker threads can share: only one of them refreshes an expiring token."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._token_lock = threading.Lock()
+
+    def get_access_token(self, *args, **kwargs):
+        with self._token_lock:
+            return super().get_access_token(*args, **kwargs)
+
+
+def pooled_spotify(auth_manager, size):
+    return spotipy.Spotify(auth_manager=auth_manager, requests_session=spotify_requests(size))
+
+
+def spotify_requests(size):
+    return mount_pool(requests.Session(), size, _spotify_retry())
+
+
+class TidalRequests(requests.Session):
+    """The `requests` session of a `tidalapi` session, refreshing its token before it expires.
+
+    tidalapi itself only refreshes after a request has failed with an expired token,
+    which every busy worker thread would otherwise run into at once. With a
+    `limiter`, every request takes a token from it first.
+    """
+
+    def __init__(self, tidal, size):
+        super().__init__()
+        self.tidal = tidal
+        self.limiter = None
+        self._token_lock = threading.Lock()
+        mount_pool(self, size)
+
+    def _expiring(self):
+        expiry_time = self.tidal.expiry_time
+        if expiry_time is None or not self.tidal.refresh_token:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if expiry_time.tzinfo is None:
+            now = now.replace(tzinfo=None)
+        return expiry_time - now < TIDAL_REFRESH_MARGIN
+
+    def request(self, method, url, *args, **kwargs):
+        limiter = self.limiter
+        if limiter is not None:
+            limiter.acquire()
+        # The token endpoint is how the refresh itself gets through
+        if url != self.tidal.config.api_oauth2_token and self._expiring():
+            with self._token_lock:
+                if self._expiring():
+                    self.tidal.token_refresh(self.tidal.refresh_token)
+            headers = kwargs.get('headers')
+            if headers and 'authorization' in headers:
+                headers['authorization'] = f"{self.tidal.token_type} {self.tidal.access_token}"
+        return super().request(method, url, *args, **kwargs)
+
+
+def manage_tidal(tidal, size):
+    """Make `tidal` refresh its token ahead of time and pool `size` connections. Safe to call again."""
+    current = tidal.request_session
+    if isinstance(current, TidalRequests):
+        mount_pool(current, size)
+        return tidal
+    managed = TidalRequests(tidal, size)
+    managed.headers.update(current.headers)
+    managed.cookies.update(current.cookies)
+    managed.proxies.update(current.proxies)
+    tidal.request_session = managed
+    current.close()
+    return tidal
+
+
+def limit_requests(tidal, limiter):
+    """Make every HTTP request `tidal` sends take a token from `limiter`.
+
+    Some tidalapi calls send several requests, e.g. an ISRC lookup fetches each
+    track it finds, so limiting calls alone lets more through than intended.
+    Returns False, changing nothing, if `tidal` is not managed by `manage_tidal`.
+    """
+    session = getattr(tidal, 'request_session', None)
+    if not isinstance(session, TidalRequests):
+        return False
+    session.limiter = limiter
+    return True
+
+
+class Clients:
+    """A Spotify client and Tidal session to keep for as long as the user stays logged in.
+
+    `resize()` adapts the connection pools to a new worker count without dropping
+    the clients or their tokens.
+    """
+
+    def __init__(self, spotify_auth, tidal, max_workers):
+        self.size = pool_size(max_workers)
+        self._spotify_requests = spotify_requests(self.size)
+        self.sp = spotipy.Spotify(auth_manager=spotify_auth, requests_session=self._spotify_requests)
+        self.tidal = manage_tidal(tidal, self.size)
+
+    def resize(self, max_workers):
+        size = pool_size(max_workers)
+        if size != self.size:
+            self.size = size
+            mount_pool(self._spotify_requests, size, _spotify_retry())
+            manage_tidal(self.tidal, size)
+        return self
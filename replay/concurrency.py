@@ -0,0 +1,226 @@
+"""Bounded worker pool with a shared rate limiter and 429 backoff."""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from spotipy.exceptions import SpotifyException
+from tidalapi.exceptions import TooManyRequests
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 10.0
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+
+_FEED_DONE = object()
+
+
+class RateLimiter:
+    """Token bucket shared by every worker, so the pool as a whole stays under `rate` calls/sec."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # A 429 seen by one worker holds back all of them
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def retry_after(error):
+    """Return the delay a 429 asks for (0 if unspecified), or None if `error` is not a rate limit."""
+    if isinstance(error, TooManyRequests):
+        return max(error.retry_after, 0)
+
+    if isinstance(error, SpotifyException):
+        if error.http_status != 429:
+            return None
+        headers = error.headers or {}
+    else:
+        response = getattr(error, 'response', None)
+        if not isinstance(response, requests.Response) or response.status_code != 429:
+            return None
+        headers = response.headers
+
+    try:
+        return max(float(headers.get('Retry-After', 0)), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def is_transient(error):
+    if isinstance(error, requests.HTTPError):
+        # A server error, e.g. one tidalapi would otherwise have reported as an invalid ISRC
+        response = getattr(error, 'response', None)
+        return isinstance(response, requests.Response) and response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class WorkerPool:
+    """Runs API calls across a bounded set of threads.
+
+    Workers never touch Streamlit; results are handed back through a queue so the
+    caller's thread can drive progress bars and `st.write` output. At most
+    `max_workers` calls are in flight at once, however many `map`s run or nest. Set
+    `limit_calls` to False when the client takes a token from `limiter` for each
+    request it sends instead.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, metrics=None):
+        self.max_workers = max(1, int(max_workers))
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+        self.limit_calls = True
+        self._in_flight = threading.BoundedSemaphore(self.max_workers)
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn` under the rate limiter, retrying 429s and dropped connections."""
+        attempt = 0
+        while True:
+            try:
+                with self._in_flight:
+                    if self.limit_calls:
+                        self.limiter.acquire()
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None and not is_transient(e):
+                    raise
+                if attempt >= self.retries:
+                    raise
+                delay = max(delay or 0, self.backoff * (2 ** attempt))
+                if retry_after(e) is not None:
+                    self.limiter.pause(delay)
+                attempt += 1
+                if self.metrics is not None:
+                    self.metrics.retry(getattr(fn, 'endpoint', getattr(fn, '__name__', 'unknown')), delay)
+                time.sleep(delay)
+
+    def map(self, fn, items, max_pending=None, max_workers=None):
+        """Run `fn(item)` for every item, yielding `(item, result, error)` as each one finishes.
+
+        `items` may be a lazy iterable such as a Spotify paginator: a feeder thread
+        pulls from it while earlier items are already being processed, and at most
+        `max_pending` items are in flight or waiting to be consumed at any time.
+        `max_workers` overrides the number of threads for this call only; their calls
+        still share the pool's `max_workers` slots.
+        """
+        max_workers = max(1, int(max_workers or self.max_workers))
+        max_pending = max_pending or max_workers * 4
+        results = queue.Queue()
+        slots = threading.Semaphore(max_pending)
+        stop = threading.Event()
+
+        def run(item):
+            try:
+                results.put((item, fn(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+
+        def feed(executor):
+            submitted = 0
+            error = None
+            try:
+                for item in items:
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    executor.submit(run, item)
+                    submitted += 1
+            except Exception as e:
+                error = e
+            finally:
+                results.put((_FEED_DONE, submitted, error))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+            feeder.start()
+            received = 0
+            submitted = None
+            feed_error = None
+            try:
+                while submitted is None or received < submitted:
+                    message = results.get()
+                    if message[0] is _FEED_DONE:
+                        _, submitted, feed_error = message
+                        continue
+                    received += 1
+                    slots.release()
+                    yield message
+                if feed_error is not None:
+                    raise feed_error
+            finally:
+                stop.set()
+                feeder.join()
+
+
+class Memo:
+    """Thread-safe memo that computes each key once, even when several threads ask for it at the same time.
+
+    Later callers for a key being computed wait for the first one. Errors are not
+    memoized, so the next caller tries again.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            pending = self._pending.setdefault(key, threading.Lock())
+        with pending:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = compute()
+            with self._lock:
+                self._values[key] = value
+                self._pending.pop(key, None)
+            return value
+
+    def peek(self, key, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    def put(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values)
@@ -0,0 +1,83 @@
+"""Stored Spotify and Tidal tokens, for running transfers outside the browser."""
+
+import datetime
+import json
+import os
+
+import tidalapi.session
+from spotipy.cache_handler import MemoryCacheHandler
+
+from replay.clients import SharedSpotifyOAuth, manage_tidal, pool_size, pooled_spotify
+from replay.concurrency import DEFAULT_WORKERS
+
+SPOTIFY_REDIRECT_URI = "https://iamreplay.streamlit.app/callback"
+SPOTIFY_SCOPE = "user-library-read playlist-read-private playlist-read-collaborative user-follow-read"
+
+
+def spotify_oauth(client_id, client_secret, token_info=None, **kwargs):
+    return SharedSpotifyOAuth(
+        client_id=client_id,
+        client_secret=client_secret,
+        redirect_uri=SPOTIFY_REDIRECT_URI,
+        scope=SPOTIFY_SCOPE,
+        cache_handler=MemoryCacheHandler(token_info),
+        **kwargs
+    )
+
+
+def load_credentials(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_credentials(path, credentials):
+    # Tokens grant full access to both accounts, so keep the file private
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(credentials, f, indent=2)
+
+
+def spotify_client(credentials, max_workers=DEFAULT_WORKERS):
+    """Build a Spotify client that refreshes its access token as needed."""
+    spotify = credentials['spotify']
+    auth_manager = spotify_oauth(
+        spotify.get('client_id') or os.environ.get('SPOTIPY_CLIENT_ID'),
+        spotify.get('client_secret') or os.environ.get('SPOTIPY_CLIENT_SECRET'),
+        token_info=spotify['token_info'],
+    )
+    return pooled_spotify(auth_manager, pool_size(max_workers))
+
+
+def tidal_session(credentials, max_workers=DEFAULT_WORKERS):
+    tidal = credentials['tidal']
+    expiry_time = tidal.get('expiry_time')
+    session = tidalapi.session.Session()
+    session.load_oauth_session(
+        tidal['token_type'],
+        tidal['access_token'],
+        tidal.get('refresh_token'),
+        datetime.datetime.fromisoformat(expiry_time) if expiry_time else None,
+    )
+    return manage_tidal(session, pool_size(max_workers))
+
+
+def tidal_credentials(session):
+    return {
+        'token_type': session.token_type,
+        'access_token': session.access_token,
+        'refresh_token': session.refresh_token,
+        'expiry_time': session.expiry_time.isoformat() if session.expiry_time else None,
+    }
+
+
+def dump_credentials(sp, tidal):
+    """Capture the current tokens of both clients, e.g. to save them after they were refreshed."""
+    auth_manager = sp.auth_manager
+    return {
+        'spotify': {
+            'client_id': auth_manager.client_id,
+            'client_secret': auth_manager.client_secret,
+            'token_info': auth_manager.cache_handler.get_cached_token(),
+        },
+        'tidal': tidal_credentials(tidal),
+    }
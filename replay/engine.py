@@ -0,0 +1,236 @@
+"""The transfer engine: runs a whole Spotify to Tidal transfer and reports it as a stream of events.
+
+Events are plain JSON-serializable dicts with a 'type' key, so the Streamlit UI,
+the CLI's NDJSON output and any other client can all consume the same stream.
+"""
+
+from dataclasses import dataclass
+from functools import partial
+
+from replay.batching import DEFAULT_CHUNK_SIZE
+from replay.cache import MatchCache, RunCache
+from replay.catalog import ArtistCatalog
+from replay.clients import limit_requests
+from replay.concurrency import DEFAULT_RATE, DEFAULT_WORKERS, WorkerPool
+from replay.jobs import FAILED, FINISHED, WRITTEN, JobStore, item_key
+from replay.metrics import instrument
+from replay.planner import build_plan
+from replay.spotify import followed_artists, saved_albums, saved_tracks, user_playlists
+from replay.sync import TidalSync, tidal_user_id
+from replay.transfer import (
+    PLAYLIST_PROGRESS,
+    PLAYLIST_SKIPPED,
+    describe_artist,
+    describe_saved_album,
+    describe_saved_track,
+    is_own_playlist,
+    match_artist,
+    match_saved_album,
+    match_saved_track,
+    saved_album_key,
+    saved_track_key,
+    transfer_playlists,
+    transfer_section,
+)
+
+SECTIONS = ('tracks', 'albums', 'artists', 'playlists')
+
+# Event types
+JOB_STARTED = 'job_started'
+SYNC_LOADING = 'sync_loading'
+SYNC_LOADED = 'sync_loaded'
+PLAN_BUILDING = 'plan_building'
+PLAN_READY = 'plan_ready'
+SECTION_FETCHING = 'section_fetching'
+SECTION_STARTED = 'section_started'
+ITEM = 'item'
+PLAYLIST = 'playlist'
+SECTION_FINISHED = 'section_finished'
+JOB_FINISHED = 'job_finished'
+
+SKIPPED = 'skipped'
+
+
+@dataclass
+class TransferOptions:
+    max_workers: int = DEFAULT_WORKERS
+    requests_per_second: float = DEFAULT_RATE
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    parallel_playlists: int = 2
+    use_cache: bool = True
+    sync: bool = False
+    plan: bool = False
+    dry_run: bool = False
+
+
+def _describe(describe, item):
+    described = describe(item)
+    if isinstance(described, tuple):
+        return described
+    return described, None
+
+
+# section -> (fetch pages, describe item, match item, checkpoint key, favorites write method)
+_SAVED_SECTIONS = {
+    'tracks': (saved_tracks, describe_saved_track, match_saved_track, saved_track_key, 'add_track'),
+    'albums': (saved_albums, describe_saved_album, match_saved_album, saved_album_key, 'add_album'),
+    'artists': (followed_artists, describe_artist, match_artist, item_key, 'add_artist'),
+}
+
+
+def _transfer_saved(section, sp, tidal, pool, cache, catalog, job, sync, options, plan):
+    fetch, describe, match, key, write = _SAVED_SECTIONS[section]
+    if section == 'tracks':
+        match = partial(match, catalog=catalog)
+    # A plan has already fetched the section and kept only what a sync still needs
+    pages = plan.saved[section] if plan is not None else fetch(sp)
+    already_done = job.finished(section)
+    yield {'type': SECTION_STARTED, 'section': section, 'total': pages.total, 'already_done': already_done}
+
+    source = sync.pending(section, pages) if sync is not None and plan is None else pages
+    results = transfer_section(pool, (item for item in source if describe(item)),
+                               partial(match, pool, tidal, cache=cache),
+                               getattr(tidal.user.favorites, write), key=key, job=job, section=section,
+                               chunk_size=options.chunk_size,
+                               existing=sync.existing[section] if sync is not None else None)
+    counts = {}
+    for done, (item, state, tidal_id, error) in enumerate(results, start=already_done + 1):
+        counts[state] = counts.get(state, 0) + 1
+        name, artist = _describe(describe, item)
+        yield {'type': ITEM, 'section': section, 'state': state, 'key': key(item), 'name': name,
+               'artist': artist, 'tidal_id': tidal_id, 'error': str(error) if error is not None else None,
+               'done': done, 'total': pages.total}
+
+    if sync is not None and not counts.get(FAILED):
+        sync.commit(section)
+    yield {'type': SECTION_FINISHED, 'section': section, 'counts': counts}
+
+
+def _transfer_playlists(sp, tidal, pool, cache, catalog, job, sync, options, user_id, plan):
+    if plan is not None:
+        playlists = plan.playlists
+    else:
+        playlists = [playlist for playlist in user_playlists(sp) if is_own_playlist(playlist, user_id)]
+    checkpoints = job.load('playlists')
+    already_done = job.finished('playlists')
+    yield {'type': SECTION_STARTED, 'section': 'playlists', 'total': len(playlists),
+           'already_done': already_done,
+           'playlists': [{'id': playlist['id'], 'name': playlist.get('name', 'Unnamed Playlist')}
+                         for playlist in playlists]}
+
+    counts = {}
+    settled = already_done
+    events = transfer_playlists(pool, sp, tidal, playlists, parallel=options.parallel_playlists, cache=cache,
+                                chunk_size=options.chunk_size, job=job, sync=sync, catalog=catalog,
+                                tracks=plan.playlist_tracks if plan is not None else None)
+    for kind, playlist, *details in events:
+        event = {'type': PLAYLIST, 'section': 'playlists', 'id': playlist['id'],
+                 'name': playlist.get('name', 'Unnamed Playlist')}
+        if kind == PLAYLIST_PROGRESS:
+            done, total = details
+            event.update(state='running', done=done, total=total)
+        elif kind == PLAYLIST_SKIPPED:
+            # Playlists the resumed job already finished are counted in `already_done`
+            if checkpoints.get(playlist['id'], (None,))[0] not in FINISHED:
+                settled += 1
+            event.update(state=SKIPPED, settled=settled)
+        else:
+            result, error = details
+            settled += 1
+            event.update(state=FAILED if error is not None else WRITTEN, settled=settled,
+                         error=str(error) if error is not None else None,
+                         added=result[0] if result else 0, total=result[1] if result else None)
+        if kind != PLAYLIST_PROGRESS:
+            counts[event['state']] = counts.get(event['state'], 0) + 1
+        yield event
+
+    yield {'type': SECTION_FINISHED, 'section': 'playlists', 'counts': counts}
+
+
+def _set_phase(metrics, phase):
+    if metrics is not None:
+        metrics.phase = phase
+
+
+def run_transfer(sp, tidal, sections, options=None, job_store=None, job=None, user_id=None, metrics=None,
+                 snapshot=None):
+    """Transfer the chosen `sections` from Spotify to Tidal, yielding progress events.
+
+    Pass an unfinished `job` to resume it; its own sections are used then. The job
+    is marked completed once every section has run. API calls, retries and backoff
+    are recorded in `metrics`, if given, under the section being transferred.
+
+    With `options.plan`, everything selected is fetched and deduplicated first, so
+    an entity saved and in several playlists is resolved once. `options.dry_run`
+    stops after the plan's report, without creating a job or writing to Tidal.
+
+    With a `LibrarySnapshot`, the library is read from it instead of Spotify, and
+    `sp` is not used.
+    """
+    options = options or TransferOptions()
+    sp = instrument(sp, metrics, 'spotify')
+    tidal = instrument(tidal, metrics, 'tidal')
+    job_store = job_store or JobStore()
+    if snapshot is not None:
+        missing = [section for section in (job.sections if job is not None else sections)
+                   if section not in snapshot.sections]
+        if missing:
+            raise ValueError(f"The library snapshot does not include {', '.join(missing)}")
+        user_id = user_id or snapshot.user_id
+    if user_id is None:
+        user_info = sp.me()
+        user_id = user_info.get('id') if isinstance(user_info, dict) else None
+    if job is None and not options.dry_run:
+        job = job_store.create(user_id, [section for section in SECTIONS if section in sections],
+                               tidal_user_id=tidal_user_id(tidal))
+    if job is not None:
+        sections = job.sections
+        job.touch()
+        yield {'type': JOB_STARTED, 'job_id': job.id, 'user_id': user_id, 'sections': job.sections}
+    else:
+        sections = [section for section in SECTIONS if section in sections]
+
+    pool = WorkerPool(max_workers=options.max_workers, rate=options.requests_per_second, metrics=metrics)
+    if limit_requests(tidal, pool.limiter):
+        pool.limit_calls = False
+    # Resolves each entity once per run, on top of the matches kept from earlier runs
+    cache = RunCache(MatchCache() if options.use_cache else None)
+    # Shared by saved tracks and playlists, which tend to repeat the same artists
+    catalog = ArtistCatalog()
+
+    sync = None
+    if options.sync:
+        _set_phase(metrics, 'sync')
+        yield {'type': SYNC_LOADING}
+        sync = TidalSync.load(pool, tidal, job_store, user_id, sections)
+        yield {'type': SYNC_LOADED, 'existing': {section: len(ids) for section, ids in sync.existing.items()},
+               'playlists': len(sync.playlists)}
+
+    plan = None
+    if options.plan or options.dry_run or snapshot is not None:
+        _set_phase(metrics, 'plan')
+        yield {'type': PLAN_BUILDING, 'sections': sections}
+        if snapshot is not None:
+            plan = snapshot.plan.pending(sections, sync=sync, job=job)
+        else:
+            plan = build_plan(pool, sp, sections, user_id, sync=sync, job=job,
+                              parallel=options.parallel_playlists)
+        yield {'type': PLAN_READY, 'dry_run': options.dry_run,
+               'report': plan.report(cache, job=job, chunk_size=options.chunk_size)}
+        if options.dry_run:
+            _set_phase(metrics, 'finish')
+            return
+
+    for section in SECTIONS:
+        if section not in sections:
+            continue
+        _set_phase(metrics, section)
+        yield {'type': SECTION_FETCHING, 'section': section}
+        if section == 'playlists':
+            yield from _transfer_playlists(sp, tidal, pool, cache, catalog, job, sync, options, user_id, plan)
+        else:
+            yield from _transfer_saved(section, sp, tidal, pool, cache, catalog, job, sync, options, plan)
+
+    _set_phase(metrics, 'finish')
+    job.finish()
+    yield {'type': JOB_FINISHED, 'job_id': job.id}
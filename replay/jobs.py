@@ -0,0 +1,172 @@
+"""Checkpointed transfer jobs that survive reruns, disconnects and expired tokens."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from replay.cache import DATA_DIR
+
+DEFAULT_JOBS_PATH = os.path.join(DATA_DIR, 'jobs.sqlite3')
+
+# Item states. An item without a row is still pending: it is stored once it has been matched.
+MATCHED = 'matched'
+WRITTEN = 'written'
+NOT_FOUND = 'not_found'
+EXISTING = 'existing'
+FAILED = 'failed'
+
+# Items in these states are skipped when a job resumes; failed ones are retried
+FINISHED = (WRITTEN, NOT_FOUND, EXISTING)
+
+RUNNING = 'running'
+COMPLETED = 'completed'
+
+
+def item_key(entity):
+    """Stable key for a Spotify object within a job: its ID, or its name and artists for local files."""
+    if not isinstance(entity, dict):
+        return None
+    if entity.get('id'):
+        return entity['id']
+    artists = ','.join(artist.get('name', '') for artist in entity.get('artists') or [] if isinstance(artist, dict))
+    return f"local:{entity.get('name', '')}|{artists}"
+
+
+def _tidal_key(tidal_user_id):
+    # tidalapi user IDs are integers; they are stored as text like the Spotify ones
+    return str(tidal_user_id) if tidal_user_id is not None else None
+
+
+class JobStore:
+    """SQLite store of transfer jobs and the state of every item in them."""
+
+    def __init__(self, path=DEFAULT_JOBS_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY, user_id TEXT, tidal_user_id TEXT, sections TEXT NOT NULL, status TEXT NOT NULL,'
+            ' created REAL NOT NULL, updated REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            ' job_id TEXT NOT NULL, section TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL,'
+            ' tidal_id TEXT, error TEXT, updated REAL NOT NULL,'
+            ' PRIMARY KEY (job_id, section, key))'
+        )
+        # Per pair of accounts: a library synced into one Tidal account is still new to another
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sync_watermarks ('
+            ' user_id TEXT NOT NULL, tidal_user_id TEXT NOT NULL, section TEXT NOT NULL, value TEXT NOT NULL,'
+            ' updated REAL NOT NULL, PRIMARY KEY (user_id, tidal_user_id, section))'
+        )
+
+    def create(self, user_id, sections, tidal_user_id=None):
+        now = time.time()
+        job = Job(self, uuid.uuid4().hex, user_id, list(sections), RUNNING, _tidal_key(tidal_user_id))
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, user_id, sections, status, created, updated, tidal_user_id)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job.id, user_id, json.dumps(job.sections), RUNNING, now, now, job.tidal_user_id),
+            )
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, user_id, sections, status, tidal_user_id FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        return self._job(row)
+
+    def latest_unfinished(self, user_id, tidal_user_id=None):
+        """Return the most recent job from `user_id` into `tidal_user_id` that has not completed, or None.
+
+        A job only resumes into the Tidal account it started in, as its checkpoints describe that account.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, user_id, sections, status, tidal_user_id FROM jobs'
+                ' WHERE user_id = ? AND tidal_user_id IS ? AND status = ? ORDER BY updated DESC LIMIT 1',
+                (user_id, _tidal_key(tidal_user_id), RUNNING),
+            ).fetchone()
+        return self._job(row)
+
+    def watermark(self, user_id, tidal_user_id, section):
+        """Return the sync watermark last stored for `section` between the two accounts, or None."""
+        rows = self._execute(
+            'SELECT value FROM sync_watermarks WHERE user_id = ? AND tidal_user_id = ? AND section = ?',
+            (user_id, _tidal_key(tidal_user_id) or '', section),
+        )
+        return rows[0][0] if rows else None
+
+    def set_watermark(self, user_id, tidal_user_id, section, value):
+        self._execute(
+            'INSERT OR REPLACE INTO sync_watermarks (user_id, tidal_user_id, section, value, updated)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            (user_id, _tidal_key(tidal_user_id) or '', section, value, time.time()),
+        )
+
+    def _job(self, row):
+        if row is None:
+            return None
+        job_id, user_id, sections, status, tidal_user_id = row
+        return Job(self, job_id, user_id, json.loads(sections), status, tidal_user_id)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+
+class Job:
+    def __init__(self, store, job_id, user_id, sections, status, tidal_user_id=None):
+        self.store = store
+        self.id = job_id
+        self.user_id = user_id
+        self.sections = sections
+        self.status = status
+        self.tidal_user_id = tidal_user_id
+
+    def mark(self, section, key, state, tidal_id=None, error=None):
+        """Checkpoint one item. Safe to call from worker threads."""
+        if key is None:
+            return
+        self.store._execute(
+            'INSERT OR REPLACE INTO items (job_id, section, key, state, tidal_id, error, updated)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self.id, section, key, state, str(tidal_id) if tidal_id is not None else None,
+             str(error) if error is not None else None, time.time()),
+        )
+
+    def load(self, section):
+        """Return `{key: (state, tidal_id)}` for every checkpointed item in `section`."""
+        rows = self.store._execute(
+            'SELECT key, state, tidal_id FROM items WHERE job_id = ? AND section = ?', (self.id, section)
+        )
+        return {key: (state, tidal_id) for key, state, tidal_id in rows}
+
+    def counts(self, section):
+        rows = self.store._execute(
+            'SELECT state, COUNT(*) FROM items WHERE job_id = ? AND section = ? GROUP BY state', (self.id, section)
+        )
+        return dict(rows)
+
+    def finished(self, section):
+        counts = self.counts(section)
+        return sum(counts.get(state, 0) for state in FINISHED)
+
+    def touch(self):
+        self.store._execute('UPDATE jobs SET updated = ? WHERE id = ?', (time.time(), self.id))
+
+    def finish(self):
+        self.status = COMPLETED
+        self.store._execute('UPDATE jobs SET status = ?, updated = ? WHERE id = ?',
+                            (COMPLETED, time.time(), self.id))
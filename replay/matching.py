@@ -0,0 +1,271 @@
+"""Match Spotify objects to Tidal: exact ISRC/UPC lookups first, then a small candidate set reranked locally.
+
+Titles and names are normalized before comparing: featured-artist credits,
+remaster/edition tags, accents and punctuation are dropped. Candidates are
+scored against one precomputed query vector of character trigrams.
+"""
+
+import functools
+import math
+import re
+import unicodedata
+from collections import Counter
+
+import requests
+import tidalapi
+from tidalapi.exceptions import InvalidISRC, InvalidUPC, ObjectNotFound
+
+SEARCH_LIMIT = 10
+MIN_SCORE = 0.7
+
+_FEATURING = re.compile(r'[(\[]\s*(?:feat|ft|featuring|with)\b\.?[^)\]]*[)\]]'
+                        r'|\s(?:feat|ft|featuring)\.?\s.*$', re.IGNORECASE)
+_VERSION_TAG = re.compile(r'\b(?:remaster(?:ed)?|deluxe|expanded|anniversary|edition|mono|stereo)\b',
+                          re.IGNORECASE)
+# Bracketed groups and ' - ' suffixes, whose parts are separated by '/', ',', ';' or another ' - '
+_QUALIFIER = re.compile(r'[(\[]([^)\]]*)[)\]]|\s-\s(.*)$')
+_QUALIFIER_PARTS = re.compile(r'\s*[/,;]\s*|\s-\s')
+_PUNCTUATION = re.compile(r'[^\w\s]|_')
+# Words that mark a different recording of the same song, which a close title must not paper over
+VARIANT_WORDS = frozenset(['live', 'remix', 'mix', 'acoustic', 'instrumental', 'demo', 'karaoke', 'unplugged',
+                           'edit', 'version', 'cover', 'reprise', 'session'])
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.casefold().replace('&', ' and ')
+    return ' '.join(_PUNCTUATION.sub(' ', text).split())
+
+
+def _drop_version_tags(match):
+    # Only the parts naming a remaster or edition go; 'Live at Wembley / 2005 Remaster' keeps its 'live'
+    qualifier = match.group(1) if match.group(1) is not None else match.group(2)
+    kept = [part for part in _QUALIFIER_PARTS.split(qualifier) if part and not _VERSION_TAG.search(part)]
+    return f" {' '.join(kept)} "
+
+
+def normalize_title(title):
+    """Reduce a track or album title to what identifies the recording.
+
+    'Song (feat. X) - 2011 Remaster' becomes 'song'; 'Song (Live)' and
+    'Song (Live / Remastered)' keep their 'live'.
+    """
+    stripped = _QUALIFIER.sub(_drop_version_tags, _FEATURING.sub(' ', title or ''))
+    return _fold(stripped) or _fold(title)
+
+
+def normalize_name(name):
+    name = _fold(name)
+    return name[4:] if name.startswith('the ') else name
+
+
+def _vector(text):
+    padded = f"  {text} "
+    counts = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+    return counts, math.sqrt(sum(count * count for count in counts.values()))
+
+
+class Text:
+    """A normalized string with its trigram vector and token set, for comparing one query against many candidates."""
+
+    __slots__ = ('text', 'vector', 'norm', 'tokens')
+
+    def __init__(self, text):
+        self.text = text
+        self.vector, self.norm = _vector(text)
+        self.tokens = set(text.split())
+
+    def similarity(self, other):
+        """Blend of trigram cosine and token overlap: spelling variants score high, extra words do not."""
+        if not self.text or not other.text:
+            return 0.0
+        if self.text == other.text:
+            return 1.0
+        small, large = sorted((self.vector, other.vector), key=len)
+        cosine = sum(count * large.get(gram, 0) for gram, count in small.items()) / (self.norm * other.norm)
+        overlap = len(self.tokens & other.tokens) / len(self.tokens | other.tokens)
+        return 0.5 * cosine + 0.5 * overlap
+
+
+def similarity(a, b):
+    return Text(normalize_title(a)).similarity(Text(normalize_title(b)))
+
+
+def spotify_artist_names(entity):
+    return [artist.get('name', '') for artist in entity.get('artists') or [] if isinstance(artist, dict)]
+
+
+def tidal_artist_names(obj):
+    artists = getattr(obj, 'artists', None) or []
+    names = [getattr(artist, 'name', '') for artist in artists]
+    if not names and getattr(obj, 'artist', None) is not None:
+        names = [obj.artist.name]
+    return names
+
+
+def _names(names):
+    return [Text(normalize_name(name)) for name in names if name]
+
+
+def artist_similarity(spotify_names, tidal_names):
+    """How well Tidal's credits cover Spotify's: the primary artist counts most, featured ones the rest."""
+    spotify, tidal = _names(spotify_names), _names(tidal_names)
+    if not spotify or not tidal:
+        return 0.0
+    best = [max(name.similarity(candidate) for candidate in tidal) for name in spotify]
+    return 0.6 * best[0] + 0.4 * sum(best) / len(best)
+
+
+def duration_similarity(spotify_ms, tidal_seconds, tolerance=10.0):
+    # 1.0 for identical lengths, falling to 0 once they differ by `tolerance` seconds
+    if not spotify_ms or not tidal_seconds:
+        return 0.5
+    return max(0.0, 1.0 - abs(spotify_ms / 1000 - tidal_seconds) / tolerance)
+
+
+def track_scorer(track):
+    """Return a function scoring Tidal candidates against `track`, normalizing the Spotify side once."""
+    title = Text(normalize_title(track.get('name')))
+    artist_names = spotify_artist_names(track)
+    duration_ms = track.get('duration_ms')
+
+    def score(candidate):
+        candidate_title = Text(normalize_title(candidate.name))
+        title_score = title.similarity(candidate_title)
+        if title.tokens & VARIANT_WORDS != candidate_title.tokens & VARIANT_WORDS:
+            title_score *= 0.5
+        return (0.45 * title_score
+                + 0.35 * artist_similarity(artist_names, tidal_artist_names(candidate))
+                + 0.20 * duration_similarity(duration_ms, getattr(candidate, 'duration', None)))
+    return score
+
+
+def album_scorer(album):
+    title = Text(normalize_title(album.get('name')))
+    artist_names = spotify_artist_names(album)
+    total = album.get('total_tracks')
+
+    def score(candidate):
+        count = getattr(candidate, 'num_tracks', None)
+        track_count = 1.0 if total and count and total == count else 0.5 if not (total and count) else 0.0
+        return (0.5 * title.similarity(Text(normalize_title(candidate.name)))
+                + 0.35 * artist_similarity(artist_names, tidal_artist_names(candidate))
+                + 0.15 * track_count)
+    return score
+
+
+def artist_scorer(artist):
+    name = Text(normalize_name(artist.get('name')))
+    return lambda candidate: name.similarity(Text(normalize_name(candidate.name)))
+
+
+def score_track(track, candidate):
+    return track_scorer(track)(candidate)
+
+
+def score_album(album, candidate):
+    return album_scorer(album)(candidate)
+
+
+def score_artist(artist, candidate):
+    return artist_scorer(artist)(candidate)
+
+
+def best_candidate(candidates, score, min_score=MIN_SCORE):
+    """Return the highest-scoring candidate, or None if none reaches `min_score`."""
+    best, best_score = None, min_score
+    for candidate in candidates or []:
+        candidate_score = score(candidate)
+        if candidate_score > best_score or (best is None and candidate_score == best_score):
+            best, best_score = candidate, candidate_score
+    return best
+
+
+def _external_id(entity, name):
+    external_ids = entity.get('external_ids')
+    if isinstance(external_ids, dict):
+        return external_ids.get(name)
+    return None
+
+
+def _search(pool, tidal, query, model, key, limit=SEARCH_LIMIT):
+    results = pool.call(tidal.search, query, models=[model], limit=limit)
+    if results and isinstance(results, dict):
+        found = results.get(key)
+        if found and isinstance(found, list):
+            return found
+    return []
+
+
+def _exact_lookup(tidal, lookup):
+    """Wrap an ISRC or UPC `lookup` so it returns [] when Tidal has no release with the ID.
+
+    tidalapi reports any failed lookup whose response has a body as an invalid ID,
+    429s and server errors included; those are raised again as the `HTTPError` they
+    were, so the worker pool backs off and retries instead of the lookup settling
+    for a search.
+    """
+    @functools.wraps(lookup)
+    def call(value):
+        try:
+            return lookup(value)
+        except ObjectNotFound:
+            return []
+        except (InvalidISRC, InvalidUPC) as e:
+            http_error = e.__context__ if isinstance(e.__context__, requests.HTTPError) else None
+            response = (http_error.response if http_error is not None
+                        else getattr(getattr(tidal, 'request', None), 'latest_err_response', None))
+            status = getattr(response, 'status_code', None)
+            if status is not None and (status == 429 or status >= 500):
+                raise (http_error or requests.HTTPError(f"{status} error on Tidal lookup", response=response)) from e
+            return []
+    return call
+
+
+def _query(entity):
+    # Featured artists are left to the scoring, where they count toward the match
+    artist_names = spotify_artist_names(entity)
+    return f"{artist_names[0] if artist_names else ''} {normalize_title(entity.get('name', ''))}".strip()
+
+
+def find_track(pool, tidal, track, catalog=None):
+    """Return the best Tidal track for a Spotify track object, or None.
+
+    With an `ArtistCatalog`, tracks by artists already seen several times are looked
+    up in that artist's memoized catalog before falling back to a search.
+    """
+    score = track_scorer(track)
+    isrc = _external_id(track, 'isrc')
+    if isrc:
+        candidates = pool.call(_exact_lookup(tidal, tidal.get_tracks_by_isrc), isrc)
+        if candidates:
+            # Every ISRC hit is the same recording; prefer the release that matches best
+            return max(candidates, key=score)
+
+    if catalog is not None:
+        found = best_candidate(catalog.candidates(pool, tidal, track), score)
+        if found is not None:
+            return found
+
+    candidates = _search(pool, tidal, _query(track), tidalapi.Track, 'tracks')
+    return best_candidate(candidates, score)
+
+
+def find_album(pool, tidal, album):
+    """Return the best Tidal album for a Spotify album object, or None."""
+    score = album_scorer(album)
+    upc = _external_id(album, 'upc')
+    if upc:
+        candidates = pool.call(_exact_lookup(tidal, tidal.get_albums_by_barcode), upc)
+        if candidates:
+            return max(candidates, key=score)
+
+    candidates = _search(pool, tidal, _query(album), tidalapi.Album, 'albums')
+    return best_candidate(candidates, score)
+
+
+def find_artist(pool, tidal, artist):
+    """Return the best Tidal artist for a Spotify artist object, or None."""
+    candidates = _search(pool, tidal, artist.get('name', ''), tidalapi.Artist, 'artists', limit=5)
+    return best_candidate(candidates, artist_scorer(artist))
@@ -0,0 +1,250 @@
+"""Per-endpoint instrumentation of Spotify and Tidal API calls.
+
+`instrument()` wraps a spotipy or tidalapi client so every method call through it
+is timed and counted under the engine's current phase. Retries and 429 backoff
+are reported by the worker pool. Results export as JSON or Prometheus text.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from replay.concurrency import retry_after
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.backoff = 0.0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds, error=None):
+        self.calls += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        if error is not None:
+            self.errors += 1
+            if retry_after(error) is not None:
+                self.rate_limited += 1
+
+    def quantile(self, q):
+        """Estimate a latency quantile by interpolating within its histogram bucket."""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.buckets):
+            if count and seen + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.rate_limited += other.rate_limited
+        self.retries += other.retries
+        self.backoff += other.backoff
+        self.total += other.total
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rate_limited': self.rate_limited,
+            'retries': self.retries,
+            'backoff_seconds': round(self.backoff, 3),
+            'total_seconds': round(self.total, 3),
+            'mean_seconds': round(self.total / self.calls, 4) if self.calls else None,
+            'p50_seconds': _round(self.quantile(0.5)),
+            'p95_seconds': _round(self.quantile(0.95)),
+            'buckets': {_bucket_label(bound): count for bound, count in zip(BUCKETS, self.buckets)},
+        }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def _bucket_label(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Thread-safe call statistics keyed by `(phase, endpoint)`.
+
+    `phase` is whatever the engine is doing at the moment, e.g. 'tracks' or 'sync';
+    calls made from worker threads are attributed to it as well.
+    """
+
+    def __init__(self):
+        self.phase = 'setup'
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, endpoint, phase=None):
+        key = (phase or self.phase, endpoint)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = EndpointStats()
+        return stats
+
+    def observe(self, endpoint, seconds, error=None):
+        with self._lock:
+            self._get(endpoint).observe(seconds, error)
+
+    def retry(self, endpoint, delay):
+        with self._lock:
+            stats = self._get(endpoint)
+            stats.retries += 1
+            stats.backoff += delay
+
+    def merge(self, other):
+        """Add another run's statistics to these ones."""
+        with other._lock:
+            items = list(other._stats.items())
+        with self._lock:
+            for (phase, endpoint), stats in items:
+                self._get(endpoint, phase).merge(stats)
+
+    @contextmanager
+    def measure(self, endpoint):
+        """Time a block of code, e.g. UI rendering, as if it were an endpoint."""
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.observe(endpoint, time.perf_counter() - started, error)
+
+    def rows(self):
+        """One dict per `(phase, endpoint)`, slowest in total first."""
+        with self._lock:
+            rows = [{'phase': phase, 'endpoint': endpoint, **stats.as_dict()}
+                    for (phase, endpoint), stats in self._stats.items()]
+        return sorted(rows, key=lambda row: row['total_seconds'], reverse=True)
+
+    def to_json(self, **kwargs):
+        return json.dumps({'generated_at': time.time(), 'endpoints': self.rows()}, **kwargs)
+
+    def to_prometheus(self, prefix='replay_api'):
+        """Render the statistics in the Prometheus text exposition format."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            lines = [f"# HELP {prefix}_call_duration_seconds Latency of Spotify and Tidal API calls.",
+                     f"# TYPE {prefix}_call_duration_seconds histogram"]
+            for (phase, endpoint), stats in items:
+                labels = f'endpoint="{_escape(endpoint)}",phase="{_escape(phase)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'{prefix}_call_duration_seconds_bucket{{{labels},le="{_bucket_label(bound)}"}} '
+                                 f'{cumulative}')
+                lines.append(f"{prefix}_call_duration_seconds_sum{{{labels}}} {stats.total}")
+                lines.append(f"{prefix}_call_duration_seconds_count{{{labels}}} {stats.calls}")
+
+            for name, attribute, help_text in [
+                ('errors_total', 'errors', "API calls that raised an error."),
+                ('rate_limited_total', 'rate_limited', "API calls answered with HTTP 429."),
+                ('retries_total', 'retries', "API calls retried by the worker pool."),
+                ('backoff_seconds_total', 'backoff', "Seconds spent backing off before retries."),
+            ]:
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for (phase, endpoint), stats in items:
+                    labels = f'endpoint="{_escape(endpoint)}",phase="{_escape(phase)}"'
+                    lines.append(f"{prefix}_{name}{{{labels}}} {getattr(stats, attribute)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumented:
+    """Proxy for an API client that records every method call in `metrics`.
+
+    Objects from the client's own package, whether attributes (`tidal.user.favorites`)
+    or call results (`tidal.playlist(id)`), are wrapped too, so their calls show up
+    as `tidal.user.favorites.add_track` or `tidal.UserPlaylist.add`.
+    """
+
+    def __init__(self, target, metrics, name, package=None):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_metrics', metrics)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_package', package or _package(target))
+
+    def _child(self, value, endpoint):
+        if _package(value) != self._package:
+            return value
+        return Instrumented(value, self._metrics, endpoint, self._package)
+
+    def _result(self, value):
+        if isinstance(value, list):
+            return [self._result(item) for item in value]
+        # Named by type, so playlists from `create_playlist` and `playlist(id)` share endpoints
+        return self._child(value, f"{self._name.split('.')[0]}.{type(value).__name__}")
+
+    def __getattr__(self, attribute):
+        value = getattr(self._target, attribute)
+        endpoint = f"{self._name}.{attribute}"
+        if callable(value) and not isinstance(value, type):
+            return self._wrap(value, endpoint)
+        return self._child(value, endpoint)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._target, attribute, value)
+
+    def _wrap(self, method, endpoint):
+        metrics = self._metrics
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                metrics.observe(endpoint, time.perf_counter() - started, e)
+                raise
+            metrics.observe(endpoint, time.perf_counter() - started)
+            if isinstance(result, dict):
+                # e.g. search results: {'artists': [Artist, ...], ...}
+                return {key: self._result(value) for key, value in result.items()}
+            return self._result(result)
+
+        call.__name__ = method.__name__ if hasattr(method, '__name__') else endpoint
+        call.endpoint = endpoint
+        return call
+
+    def __repr__(self):
+        return f"Instrumented({self._target!r})"
+
+
+def _package(obj):
+    return type(obj).__module__.split('.')[0]
+
+
+def instrument(client, metrics, name):
+    """Wrap `client` so its API calls are recorded in `metrics`; returns it unchanged if `metrics` is None."""
+    if metrics is None:
+        return client
+    return Instrumented(client, metrics, name)
@@ -0,0 +1,225 @@
+"""Plan a transfer before running it: collect everything selected, deduplicate it, and estimate the API calls.
+
+The same song can be a saved track and sit in several playlists; the plan keeps
+one slim copy of it and counts the references, so it is resolved once and the
+result fanned out to every favorites and playlist write that needs it.
+"""
+
+import math
+import threading
+from collections import Counter
+
+from replay.batching import DEFAULT_CHUNK_SIZE, PLAYLIST_CHUNK_LIMIT
+from replay.cache import MISS, cache_keys
+from replay.jobs import FINISHED, item_key
+from replay.spotify import Listing, followed_artists, playlist_tracks, saved_albums, saved_tracks, user_playlists
+from replay.transfer import describe_artist, describe_saved_album, describe_saved_track, is_own_playlist
+
+# kind in the plan -> (match cache kind, external ID that allows an exact lookup)
+_KINDS = {'tracks': ('track', 'isrc'), 'albums': ('album', 'upc'), 'artists': ('artist', None)}
+
+
+def _slim_artists(entity):
+    return [{'id': artist.get('id'), 'name': artist.get('name', '')}
+            for artist in entity.get('artists') or [] if isinstance(artist, dict)]
+
+
+def _slim_external_ids(entity, name):
+    external_ids = entity.get('external_ids')
+    if isinstance(external_ids, dict) and external_ids.get(name):
+        return {name: external_ids[name]}
+    return {}
+
+
+def slim_album(album):
+    """Keep only the fields matching and progress reporting read, to hold large libraries in memory."""
+    return {'id': album.get('id'), 'name': album.get('name', 'Unknown Album'), 'type': 'album',
+            'artists': _slim_artists(album), 'total_tracks': album.get('total_tracks'),
+            'external_ids': _slim_external_ids(album, 'upc')}
+
+
+def slim_track(track):
+    album = track.get('album')
+    return {'id': track.get('id'), 'name': track.get('name', 'Unknown Track'), 'type': 'track',
+            'is_local': track.get('is_local', False), 'duration_ms': track.get('duration_ms'),
+            'artists': _slim_artists(track), 'album': slim_album(album) if isinstance(album, dict) else None,
+            'external_ids': _slim_external_ids(track, 'isrc')}
+
+
+def slim_artist(artist):
+    return {'id': artist.get('id'), 'name': artist.get('name', 'Unknown Artist'), 'type': 'artist'}
+
+
+# kind -> (key of the entity in a listed item, slim copy, describe item)
+_ITEMS = {'tracks': ('track', slim_track, describe_saved_track),
+          'albums': ('album', slim_album, describe_saved_album),
+          'artists': (None, slim_artist, describe_artist)}
+
+
+class Plan:
+    """Everything a transfer will touch, with each track, album and artist stored once.
+
+    `saved` holds a `Listing` per saved section, `playlists` the own playlists in
+    order and `playlist_tracks` a `Listing` per playlist whose tracks were fetched.
+    """
+
+    def __init__(self):
+        self.saved = {}
+        self.playlists = []
+        self.playlist_tracks = {}
+        self.entities = {kind: {} for kind in _KINDS}
+        self.spotify_calls = 0
+        self._lock = threading.Lock()
+
+    def _intern(self, kind, entity, slim):
+        key = item_key(entity)
+        with self._lock:
+            known = self.entities[kind].get(key)
+            if known is None:
+                known = self.entities[kind][key] = slim(entity)
+            return known
+
+    def listed(self, kind, entity, added_at=None):
+        """The item a Spotify listing of `kind` holds for `entity`, e.g. a saved track for a track."""
+        field = _ITEMS[kind][0]
+        return entity if field is None else {'added_at': added_at, field: entity}
+
+    def collect(self, pages, items, kind):
+        """Intern the well-formed `items`, read from `pages`, into a `Listing` of slim items of `kind`."""
+        field, slim, describe = _ITEMS[kind]
+        listing = []
+        for item in items:
+            if describe(item):
+                entity = self._intern(kind, item[field] if field else item, slim)
+                listing.append(self.listed(kind, entity, item.get('added_at')))
+        with self._lock:
+            self.spotify_calls += pages.fetched
+        return Listing(listing)
+
+    def pending(self, sections, sync=None, job=None):
+        """The part of this plan `build_plan` would have collected for `sections` with `sync` and `job`.
+
+        Lets a plan loaded from a library snapshot stand in for one fetched live.
+        """
+        plan = Plan()
+        plan.entities = self.entities
+        for section, listing in self.saved.items():
+            if section in sections:
+                plan.saved[section] = Listing(list(sync.pending(section, listing))) if sync is not None else listing
+        if 'playlists' not in sections:
+            return plan
+        plan.playlists = self.playlists
+        plan.playlist_tracks = {playlist['id']: self.playlist_tracks[playlist['id']]
+                                for playlist in _to_read(self.playlists, sync, job)
+                                if playlist['id'] in self.playlist_tracks}
+        return plan
+
+    def _references(self, job, chunk_size):
+        """How often each entity still to resolve is referenced, per kind, and the writes still to make."""
+        references = {kind: Counter() for kind in _KINDS}
+        writes = 0
+        for section, listing in self.saved.items():
+            finished = job.load(section) if job is not None else {}
+            field = _ITEMS[section][0]
+            keys = [item_key(item[field] if field else item) for item in listing]
+            keys = [key for key in keys if finished.get(key, (None,))[0] not in FINISHED]
+            references[section].update(keys)
+            writes += math.ceil(len(keys) / chunk_size)
+        playlist_chunk = min(chunk_size, PLAYLIST_CHUNK_LIMIT)
+        for listing in self.playlist_tracks.values():
+            references['tracks'].update(item_key(item['track']) for item in listing)
+            writes += 1 + math.ceil(len(listing) / playlist_chunk)
+        return references, writes
+
+    def report(self, cache=None, job=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Estimate the API calls the transfer will make, as a JSON-serializable dict.
+
+        Tidal lookups count HTTP requests. An ISRC or UPC lookup sends one request and
+        then one per release it finds, or falls back to a search when it finds none,
+        so it costs at least two; the upper bound assumes at most two releases share
+        the ID, which a recording on several compilations can exceed. Matches already
+        in `cache` cost nothing, and writes assume every item matches.
+        """
+        references, writes = self._references(job, max(1, chunk_size))
+        cached = Counter()
+        lookups = {'min': 0, 'max': 0}
+        without_dedup = {'min': 0, 'max': 0}
+        for kind, counts in references.items():
+            cache_kind, external_id = _KINDS[kind]
+            for key, count in counts.items():
+                entity = self.entities[kind][key]
+                if cache is not None and cache.lookup(cache_kind, cache_keys(entity, external_id)) is not MISS:
+                    cached[kind] += 1
+                    continue
+                least, most = (2, 3) if external_id is not None and entity['external_ids'] else (1, 1)
+                lookups['min'] += least
+                lookups['max'] += most
+                without_dedup['min'] += least * count
+                without_dedup['max'] += most * count
+        return {
+            'items': {kind: sum(counts.values()) for kind, counts in references.items()},
+            'unique': {kind: len(counts) for kind, counts in references.items()},
+            'cached': dict(cached),
+            'playlists': len(self.playlists),
+            'api_calls': {
+                'spotify': self.spotify_calls,
+                'tidal_lookups': lookups,
+                'tidal_lookups_without_dedup': without_dedup,
+                'tidal_writes': writes,
+                'total': {bound: self.spotify_calls + lookups[bound] + writes for bound in ('min', 'max')},
+            },
+        }
+
+
+def _to_read(playlists, sync, job):
+    # Playlists a resumed job finished, or unchanged since the last sync, are not transferred again
+    finished = job.load('playlists') if job is not None else {}
+    return [playlist for playlist in playlists
+            if finished.get(playlist['id'], (None,))[0] not in FINISHED
+            and not (sync is not None and sync.playlist_unchanged(playlist))]
+
+
+def build_plan(pool, sp, sections, user_id, sync=None, job=None, parallel=1):
+    """Fetch every selected Spotify item and deduplicate it into a `Plan`.
+
+    With a `sync`, only saved items added since the last sync are collected and
+    playlists unchanged since then are not read. Playlists a resumed `job` already
+    finished are not read either.
+    """
+    plan = Plan()
+    fetchers = {'tracks': saved_tracks, 'albums': saved_albums, 'artists': followed_artists}
+    for section, fetch in fetchers.items():
+        if section not in sections:
+            continue
+        pages = fetch(sp)
+        items = sync.pending(section, pages) if sync is not None else pages
+        plan.saved[section] = plan.collect(pages, items, section)
+
+    if 'playlists' not in sections:
+        return plan
+    pages = user_playlists(sp)
+    plan.playlists = [playlist for playlist in pages if is_own_playlist(playlist, user_id)]
+    plan.spotify_calls += pages.fetched
+
+    def read(playlist):
+        tracks = playlist_tracks(sp, playlist['id'])
+        return plan.collect(tracks, tracks, 'tracks')
+
+    for playlist, listing, error in pool.map(read, _to_read(plan.playlists, sync, job), max_workers=parallel):
+        # A playlist that cannot be read now is fetched again, and fails on its own, when transferred
+        if error is None:
+            plan.playlist_tracks[playlist['id']] = listing
+    return plan
+
+
+def summarize_report(report):
+    """One line describing a plan's `report()`."""
+    calls = report['api_calls']
+    total, lookups, without = calls['total'], calls['tidal_lookups'], calls['tidal_lookups_without_dedup']
+    counts = ', '.join(f"{report['unique'][kind]} unique of {count} {kind}"
+                       + (f" ({report['cached'][kind]} cached)" if report['cached'].get(kind) else '')
+                       for kind, count in report['items'].items() if count)
+    return (f"{counts or 'nothing to transfer'}, {report['playlists']} playlists; "
+            f"{total['min']}-{total['max']} API calls: {calls['spotify']} Spotify, "
+            f"{lookups['min']}-{lookups['max']} Tidal lookup requests ({without['min']}-{without['max']} without "
+            f"deduplication), {calls['tidal_writes']} Tidal writes")
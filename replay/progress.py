@@ -0,0 +1,106 @@
+"""Aggregate engine events into counters, throughput and ETA, for throttled UI updates."""
+
+import time
+from collections import deque
+
+from replay.engine import ITEM, PLAYLIST, SECTION_FINISHED, SECTION_STARTED
+from replay.jobs import FAILED, NOT_FOUND
+
+DEFAULT_INTERVAL = 0.25
+RATE_WINDOW = 10.0
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '—'
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+class SectionProgress:
+    def __init__(self, section, total, already_done=0):
+        self.section = section
+        self.total = total
+        self.done = already_done
+        self.counts = {}
+        self.finished = False
+        self._samples = deque([(time.monotonic(), already_done)])
+
+    def record(self, state, done=None):
+        self.counts[state] = self.counts.get(state, 0) + 1
+        self.done = done if done is not None else self.done + 1
+        now = time.monotonic()
+        self._samples.append((now, self.done))
+        # Keep one sample older than the window so the rate spans all of it
+        while len(self._samples) > 2 and now - self._samples[1][0] > RATE_WINDOW:
+            self._samples.popleft()
+
+    @property
+    def fraction(self):
+        return min(self.done / max(self.total, 1), 1.0) if not self.finished else 1.0
+
+    def rate(self):
+        """Items per second over the last few seconds."""
+        (start, start_done), (end, end_done) = self._samples[0], self._samples[-1]
+        if end - start <= 0:
+            return 0.0
+        return (end_done - start_done) / (end - start)
+
+    def eta(self):
+        rate = self.rate()
+        if self.finished:
+            return 0
+        if rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def summary(self):
+        counts = ' · '.join(f"{count} {state.replace('_', ' ')}" for state, count in sorted(self.counts.items()))
+        return (f"{self.done:,} / {self.total:,} · {self.rate():.1f} items/s · "
+                f"ETA {format_duration(self.eta())}" + (f" · {counts}" if counts else ''))
+
+
+class ProgressTracker:
+    """Folds the engine's event stream into per-section progress and a list of failures.
+
+    `due()` tells the caller when the UI should be redrawn, so rendering happens at a
+    fixed rate however fast events arrive.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.sections = {}
+        self.playlists = {}
+        self.failures = []
+        self._last_render = 0.0
+
+    def update(self, event):
+        kind = event['type']
+        section = event.get('section')
+        if kind == SECTION_STARTED:
+            self.sections[section] = SectionProgress(section, event['total'], event['already_done'])
+        elif kind == ITEM:
+            self.sections[section].record(event['state'], event['done'])
+            if event['state'] in (FAILED, NOT_FOUND):
+                self.failures.append({'section': section, 'name': event['name'], 'artist': event['artist'],
+                                      'reason': event['error'] or 'Not found on Tidal'})
+        elif kind == PLAYLIST:
+            self.playlists[event['id']] = event
+            if event['state'] != 'running':
+                self.sections[section].record(event['state'], event['settled'])
+            if event['state'] == FAILED:
+                self.failures.append({'section': section, 'name': event['name'], 'artist': None,
+                                      'reason': event['error']})
+        elif kind == SECTION_FINISHED:
+            self.sections[section].finished = True
+
+    def due(self, force=False):
+        now = time.monotonic()
+        if force or now - self._last_render >= self.interval:
+            self._last_render = now
+            return True
+        return False
@@ -0,0 +1,136 @@
+"""Library snapshots: a Spotify library exported once to gzipped NDJSON and transferred from offline.
+
+The first line describes the snapshot; every other line is one record. Each
+track, album and artist is written once, before the first record that refers
+to it by key, so the file can be written and read in one streaming pass:
+
+    {"type": "snapshot", "version": 1, "user_id": ..., "created_at": ..., "sections": [...]}
+    {"type": "track", "key": ..., "entity": {...}}
+    {"type": "saved", "section": "tracks", "key": ..., "added_at": ...}
+    {"type": "playlist", "playlist": {"id": ..., "name": ..., "snapshot_id": ..., "owner": {"id": ...}}}
+    {"type": "playlist_track", "playlist": ..., "key": ..., "added_at": ...}
+
+Playlist tracks follow their playlist in playlist order.
+"""
+
+import datetime
+import gzip
+import json
+
+from replay.concurrency import WorkerPool
+from replay.engine import SECTIONS
+from replay.jobs import item_key
+from replay.planner import Plan, build_plan
+from replay.spotify import Listing, playlist_tracks
+
+VERSION = 1
+
+# plan kind -> entity record type
+_RECORD_TYPES = {'tracks': 'track', 'albums': 'album', 'artists': 'artist'}
+
+
+class LibrarySnapshot:
+    """A library loaded from, or exported to, a snapshot file. `plan` holds its content."""
+
+    def __init__(self, plan, user_id, sections, created_at=None):
+        self.plan = plan
+        self.user_id = user_id
+        self.sections = list(sections)
+        self.created_at = created_at
+
+
+def slim_playlist(playlist):
+    owner = playlist.get('owner') if isinstance(playlist.get('owner'), dict) else {}
+    return {'id': playlist['id'], 'name': playlist.get('name', 'Unnamed Playlist'),
+            'snapshot_id': playlist.get('snapshot_id'), 'owner': {'id': owner.get('id')}}
+
+
+def _records(snapshot):
+    plan = snapshot.plan
+    yield {'type': 'snapshot', 'version': VERSION, 'user_id': snapshot.user_id, 'created_at': snapshot.created_at,
+           'sections': snapshot.sections}
+    written = set()
+
+    def reference(kind, item):
+        entity = item if kind == 'artists' else item[_RECORD_TYPES[kind]]
+        key = item_key(entity)
+        if (kind, key) not in written:
+            written.add((kind, key))
+            yield {'type': _RECORD_TYPES[kind], 'key': key, 'entity': entity}
+        return key
+
+    for section, listing in plan.saved.items():
+        for item in listing:
+            key = yield from reference(section, item)
+            record = {'type': 'saved', 'section': section, 'key': key}
+            if section != 'artists':
+                record['added_at'] = item.get('added_at')
+            yield record
+    for playlist in plan.playlists:
+        yield {'type': 'playlist', 'playlist': slim_playlist(playlist)}
+        for item in plan.playlist_tracks.get(playlist['id'], ()):
+            key = yield from reference('tracks', item)
+            yield {'type': 'playlist_track', 'playlist': playlist['id'], 'key': key, 'added_at': item.get('added_at')}
+
+
+def write_snapshot(file, snapshot):
+    """Write `snapshot` to `file`, a path or a binary file object."""
+    with gzip.open(file, 'wt', encoding='utf-8', compresslevel=6) as f:
+        for record in _records(snapshot):
+            f.write(json.dumps(record, separators=(',', ':')))
+            f.write('\n')
+
+
+def read_snapshot(file):
+    """Load a `LibrarySnapshot` from `file`, a path or a binary file object."""
+    with gzip.open(file, 'rt', encoding='utf-8') as f:
+        lines = (line for line in f if line.strip())
+        header = json.loads(next(lines, 'null'))
+        if not isinstance(header, dict) or header.get('type') != 'snapshot':
+            raise ValueError("Not a library snapshot")
+        if header.get('version') != VERSION:
+            raise ValueError(f"Unsupported library snapshot version: {header.get('version')}")
+
+        plan = Plan()
+        kinds = {record_type: kind for kind, record_type in _RECORD_TYPES.items()}
+        saved = {section: [] for section in header['sections'] if section != 'playlists'}
+        tracks = {}
+        for line in lines:
+            record = json.loads(line)
+            kind = record['type']
+            if kind in kinds:
+                plan.entities[kinds[kind]][record['key']] = record['entity']
+            elif kind == 'saved':
+                section = record['section']
+                entity = plan.entities[section][record['key']]
+                saved[section].append(plan.listed(section, entity, record.get('added_at')))
+            elif kind == 'playlist':
+                plan.playlists.append(record['playlist'])
+                tracks[record['playlist']['id']] = []
+            elif kind == 'playlist_track':
+                entity = plan.entities['tracks'][record['key']]
+                tracks[record['playlist']].append(plan.listed('tracks', entity, record.get('added_at')))
+    plan.saved = {section: Listing(items) for section, items in saved.items()}
+    plan.playlist_tracks = {playlist_id: Listing(items) for playlist_id, items in tracks.items()}
+    return LibrarySnapshot(plan, header.get('user_id'), header['sections'], header.get('created_at'))
+
+
+def export_library(sp, file, sections=SECTIONS, user_id=None, parallel=2):
+    """Fetch the chosen `sections` of the Spotify library and write them to `file` as a snapshot.
+
+    Returns the `LibrarySnapshot`. Unlike a transfer, every own playlist must be
+    read: one that cannot be is an error rather than left for later.
+    """
+    if user_id is None:
+        user_info = sp.me()
+        user_id = user_info.get('id') if isinstance(user_info, dict) else None
+    sections = [section for section in SECTIONS if section in sections]
+    plan = build_plan(WorkerPool(max_workers=parallel), sp, sections, user_id, parallel=parallel)
+    for playlist in plan.playlists:
+        if playlist['id'] not in plan.playlist_tracks:
+            items = playlist_tracks(sp, playlist['id'])
+            plan.playlist_tracks[playlist['id']] = plan.collect(items, items, 'tracks')
+    created_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    snapshot = LibrarySnapshot(plan, user_id, sections, created_at)
+    write_snapshot(file, snapshot)
+    return snapshot
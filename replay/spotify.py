@@ -0,0 +1,70 @@
+"""Lazy iteration over Spotify paging objects, and fully fetched listings that stand in for them."""
+
+PAGE_SIZE = 50
+
+
+class Pages:
+    """Iterates the items of a Spotify paging object, fetching each `next` page only when needed.
+
+    Only the first page is fetched up front, for `total`. `container` names the key
+    the paging object sits under, e.g. 'artists' for followed artists. `fetched`
+    counts the pages requested so far.
+    """
+
+    def __init__(self, sp, first_page, container=None):
+        self.sp = sp
+        self.container = container
+        self.first_page = first_page
+        self.fetched = 1
+        paging = self._paging(first_page)
+        self.total = paging.get('total') or 0
+
+    def _paging(self, results):
+        if self.container:
+            results = results.get(self.container) or {}
+        return results if isinstance(results, dict) else {}
+
+    def __iter__(self):
+        paging = self._paging(self.first_page)
+        while True:
+            for item in paging.get('items') or []:
+                yield item
+            if not paging.get('next'):
+                return
+            paging = self._paging(self.sp.next(paging))
+            self.fetched += 1
+
+
+class Listing:
+    """Items fetched ahead of time, usable wherever `Pages` is."""
+
+    def __init__(self, items):
+        self.items = items
+        self.total = len(items)
+        self.first_page = {'items': items[:PAGE_SIZE]}
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return self.total
+
+
+def saved_tracks(sp):
+    return Pages(sp, sp.current_user_saved_tracks(limit=PAGE_SIZE))
+
+
+def saved_albums(sp):
+    return Pages(sp, sp.current_user_saved_albums(limit=PAGE_SIZE))
+
+
+def followed_artists(sp):
+    return Pages(sp, sp.current_user_followed_artists(limit=PAGE_SIZE), container='artists')
+
+
+def user_playlists(sp):
+    return Pages(sp, sp.current_user_playlists(limit=PAGE_SIZE))
+
+
+def playlist_tracks(sp, playlist_id):
+    return Pages(sp, sp.playlist_tracks(playlist_id, limit=100))
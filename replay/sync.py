@@ -0,0 +1,94 @@
+"""Delta sync: transfer only what the Tidal account does not already have."""
+
+FAVORITES_PAGE_SIZE = 1000
+PLAYLIST_PAGE_SIZE = 100
+
+
+def _collect_ids(pool, fetch, page_size):
+    ids = set()
+    offset = 0
+    while True:
+        page = pool.call(fetch, limit=page_size, offset=offset)
+        ids.update(str(obj.id) for obj in page)
+        if len(page) < page_size:
+            return ids
+        offset += page_size
+
+
+def tidal_user_id(tidal):
+    """ID of the Tidal account `tidal` is logged into, which sync state and jobs are kept per."""
+    user = getattr(tidal, 'user', None)
+    return getattr(user, 'id', None)
+
+
+def newer_than(items, watermark):
+    """Yield items until the first one added at or before `watermark`.
+
+    Spotify returns saved tracks and albums newest first, so everything after that
+    point was already handled by an earlier sync.
+    """
+    for item in items:
+        if watermark and isinstance(item, dict) and (item.get('added_at') or '') <= watermark:
+            return
+        yield item
+
+
+class TidalSync:
+    """What the Tidal account already holds, loaded once, plus the per-section sync watermarks.
+
+    Favorites are kept as in-memory sets of Tidal IDs so checking an item costs
+    nothing; playlists are indexed by name so a synced playlist is reused instead
+    of created again.
+    """
+
+    def __init__(self, store, user_id, tidal_user_id=None, tracks=(), albums=(), artists=(), playlists=()):
+        self.store = store
+        self.user_id = user_id
+        self.tidal_user_id = tidal_user_id
+        self.existing = {'tracks': set(tracks), 'albums': set(albums), 'artists': set(artists)}
+        self.playlists = {}
+        for playlist in playlists:
+            self.playlists.setdefault(playlist.name, playlist)
+        self._newest = {}
+
+    @classmethod
+    def load(cls, pool, tidal, store, user_id, sections):
+        favorites = tidal.user.favorites
+        return cls(
+            store, user_id, tidal_user_id(tidal),
+            tracks=_collect_ids(pool, favorites.tracks, FAVORITES_PAGE_SIZE) if 'tracks' in sections else (),
+            albums=_collect_ids(pool, favorites.albums, FAVORITES_PAGE_SIZE) if 'albums' in sections else (),
+            artists=_collect_ids(pool, favorites.artists, FAVORITES_PAGE_SIZE) if 'artists' in sections else (),
+            playlists=pool.call(tidal.user.playlists) if 'playlists' in sections else (),
+        )
+
+    def pending(self, section, pages):
+        """Return the items of `pages` added since the last completed sync of `section`."""
+        first_items = pages.first_page.get('items') or []
+        added = [item.get('added_at') for item in first_items if isinstance(item, dict) and item.get('added_at')]
+        if added:
+            self._newest[section] = max(added)
+        return newer_than(pages, self.store.watermark(self.user_id, self.tidal_user_id, section))
+
+    def commit(self, section):
+        """Advance the watermark of `section`; call only once every pending item has settled."""
+        if section in self._newest:
+            self.store.set_watermark(self.user_id, self.tidal_user_id, section, self._newest[section])
+
+    def tidal_playlist(self, playlist):
+        return self.playlists.get(playlist.get('name', 'Unnamed Playlist'))
+
+    def playlist_unchanged(self, playlist):
+        # Spotify changes a playlist's snapshot_id on every edit
+        snapshot_id = playlist.get('snapshot_id')
+        return (snapshot_id is not None and self.tidal_playlist(playlist) is not None
+                and self.store.watermark(self.user_id, self.tidal_user_id, f"playlist:{playlist['id']}")
+                == snapshot_id)
+
+    def commit_playlist(self, playlist):
+        if playlist.get('snapshot_id'):
+            self.store.set_watermark(self.user_id, self.tidal_user_id, f"playlist:{playlist['id']}",
+                                     playlist['snapshot_id'])
+
+    def playlist_track_ids(self, pool, tidal_playlist):
+        return _collect_ids(pool, tidal_playlist.tracks, PLAYLIST_PAGE_SIZE)
@@ -0,0 +1,291 @@
+"""Per-item transfer steps run by the worker pool."""
+
+import queue
+import threading
+
+from replay.batching import DEFAULT_CHUNK_SIZE, PLAYLIST_CHUNK_LIMIT, WriteBatcher
+from replay.cache import cache_keys
+from replay.jobs import EXISTING, FAILED, FINISHED, MATCHED, NOT_FOUND, WRITTEN, item_key
+from replay.matching import find_album, find_artist, find_track
+from replay.spotify import playlist_tracks
+
+PLAYLIST_PROGRESS = 'progress'
+PLAYLIST_DONE = 'done'
+PLAYLIST_SKIPPED = 'skipped'
+
+
+class TransferCancelled(Exception):
+    """Raised inside a worker when the caller stopped consuming the transfer."""
+
+
+def first_artist_name(entity, default='Unknown Artist'):
+    artists = entity.get('artists')
+    if artists and isinstance(artists, list) and len(artists) > 0:
+        first_artist = artists[0]
+        if isinstance(first_artist, dict):
+            return first_artist.get('name', default)
+    return default
+
+
+def describe_saved_track(item):
+    """Return `(track_name, artist_name)` for a saved-track item, or None if it is malformed."""
+    if not isinstance(item, dict):
+        return None
+    track = item.get('track')
+    if not track or not isinstance(track, dict):
+        return None
+    return track.get('name', 'Unknown Track'), first_artist_name(track)
+
+
+def describe_saved_album(item):
+    """Return `(album_name, artist_name)` for a saved-album item, or None if it is malformed."""
+    if not isinstance(item, dict):
+        return None
+    album = item.get('album')
+    if not album or not isinstance(album, dict):
+        return None
+    return album.get('name', 'Unknown Album'), first_artist_name(album)
+
+
+def describe_artist(artist):
+    if not artist or not isinstance(artist, dict):
+        return None
+    return artist.get('name', 'Unknown Artist')
+
+
+def _cached_match(cache, kind, keys, search):
+    def lookup():
+        found = search()
+        return str(found.id) if found is not None else None
+    if cache is None:
+        return lookup()
+    return cache.resolve(kind, keys, lookup)
+
+
+def match_track(pool, tidal, track, cache=None, catalog=None):
+    """Resolve a Spotify track object to a Tidal track ID, or None if Tidal has no match."""
+    return _cached_match(cache, 'track', cache_keys(track, 'isrc'),
+                         lambda: find_track(pool, tidal, track, catalog=catalog))
+
+
+def match_album(pool, tidal, album, cache=None):
+    """Resolve a Spotify album object to a Tidal album ID, or None if Tidal has no match."""
+    return _cached_match(cache, 'album', cache_keys(album, 'upc'), lambda: find_album(pool, tidal, album))
+
+
+def match_artist(pool, tidal, artist, cache=None):
+    """Resolve a Spotify artist object to a Tidal artist ID, or None if Tidal has no match."""
+    return _cached_match(cache, 'artist', cache_keys(artist), lambda: find_artist(pool, tidal, artist))
+
+
+def match_saved_track(pool, tidal, item, cache=None, catalog=None):
+    return match_track(pool, tidal, item['track'], cache, catalog)
+
+
+def match_saved_album(pool, tidal, item, cache=None):
+    return match_album(pool, tidal, item['album'], cache)
+
+
+def saved_track_key(item):
+    return item_key(item['track'])
+
+
+def saved_album_key(item):
+    return item_key(item['album'])
+
+
+def transfer_section(pool, items, match, write, key=item_key, job=None, section=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, existing=None):
+    """Match `items` on the pool and write the matches in chunks with `write`.
+
+    Yields `(item, state, tidal_id, error)` as each item settles, where `state` is
+    one of the job item states. Matches already in the `existing` set of Tidal IDs
+    are not written again. With a `job`, every item is checkpointed under `section`:
+    finished items are skipped and items matched on an earlier run go straight to
+    the write stage.
+    """
+    checkpoints = job.load(section) if job is not None else {}
+
+    def resolve(item):
+        state, tidal_id = checkpoints.get(key(item), (None, None))
+        if state in (MATCHED, FAILED) and tidal_id is not None:
+            return tidal_id
+        tidal_id = match(item)
+        if job is not None:
+            job.mark(section, key(item), MATCHED if tidal_id is not None else NOT_FOUND, tidal_id)
+        return tidal_id
+
+    def settle(item, state, tidal_id, error=None):
+        if job is not None and state != NOT_FOUND:
+            job.mark(section, key(item), state, tidal_id, error)
+        if existing is not None and state == WRITTEN:
+            existing.add(tidal_id)
+        return item, state, tidal_id, error
+
+    pending = (item for item in items if checkpoints.get(key(item), (None,))[0] not in FINISHED)
+    writer = WriteBatcher(pool, write, chunk_size=chunk_size)
+    for item, tidal_id, error in pool.map(resolve, pending):
+        if error is not None:
+            yield settle(item, FAILED, None, error)
+        elif tidal_id is None:
+            yield settle(item, NOT_FOUND, None)
+        elif existing is not None and tidal_id in existing:
+            yield settle(item, EXISTING, tidal_id)
+        else:
+            for (written, written_id), write_error in writer.add(tidal_id, (item, tidal_id)):
+                yield settle(written, FAILED if write_error is not None else WRITTEN, written_id, write_error)
+    for (written, written_id), write_error in writer.flush():
+        yield settle(written, FAILED if write_error is not None else WRITTEN, written_id, write_error)
+
+
+def transfer_playlist(pool, sp, tidal, playlist, cache=None, chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None,
+                      tidal_playlist_id=None, on_created=None, sync=None, catalog=None, tracks=None, stop=None):
+    """Copy one Spotify playlist into a new Tidal playlist, keeping its track order.
+
+    Tracks are matched in parallel and reassembled in order before being appended.
+    Returns `(added, total)`; `on_progress(done, total)` is called as tracks resolve.
+    Pass `tidal_playlist_id` to fill a playlist created by an interrupted run;
+    tracks already in it are skipped by Tidal. With a `sync`, a Tidal playlist of
+    the same name is reused and only the tracks it lacks are appended. `tracks`
+    are the playlist's items if a plan already fetched them. Once the `stop` event
+    is set, no further tracks are appended and `TransferCancelled` is raised.
+    """
+    if tracks is None:
+        tracks = playlist_tracks(sp, playlist['id'])
+    existing = set()
+    if tidal_playlist_id is not None:
+        new_playlist = pool.call(tidal.playlist, tidal_playlist_id)
+    elif sync is not None and sync.tidal_playlist(playlist) is not None:
+        new_playlist = sync.tidal_playlist(playlist)
+        existing = sync.playlist_track_ids(pool, new_playlist)
+        if on_created is not None:
+            on_created(new_playlist.id)
+    else:
+        new_playlist = pool.call(tidal.user.create_playlist, playlist.get('name', 'Unnamed Playlist'), "")
+        if on_created is not None:
+            on_created(new_playlist.id)
+    writer = WriteBatcher(pool, new_playlist.add, chunk_size=min(chunk_size, PLAYLIST_CHUNK_LIMIT))
+
+    def match(entry):
+        return match_track(pool, tidal, entry[1]['track'], cache, catalog)
+
+    outcomes = []
+    resolved = {}
+    next_index = 0
+    done = 0
+    entries = enumerate(item for item in tracks if describe_saved_track(item))
+    results = pool.map(match, entries)
+    try:
+        for (index, _), tidal_id, error in results:
+            if stop is not None and stop.is_set():
+                raise TransferCancelled(playlist.get('name', 'Unnamed Playlist'))
+            # Tracks that fail to match are left out, as Tidal would not have them anyway
+            resolved[index] = tidal_id if error is None else None
+            while next_index in resolved:
+                tidal_id = resolved.pop(next_index)
+                next_index += 1
+                if tidal_id is not None and tidal_id not in existing:
+                    existing.add(tidal_id)
+                    outcomes.extend(writer.add(tidal_id))
+            done += 1
+            if on_progress is not None:
+                on_progress(done, tracks.total)
+    finally:
+        # Stops feeding tracks and waits for the ones in flight, as when the caller stops iterating
+        results.close()
+    if stop is not None and stop.is_set():
+        raise TransferCancelled(playlist.get('name', 'Unnamed Playlist'))
+    outcomes.extend(writer.flush())
+
+    failed = [error for _, error in outcomes if error is not None]
+    if failed:
+        raise failed[0]
+    return len(outcomes), tracks.total
+
+
+def transfer_playlists(pool, sp, tidal, playlists, parallel=1, cache=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                       job=None, sync=None, catalog=None, tracks=None):
+    """Transfer up to `parallel` playlists at once.
+
+    Yields `(PLAYLIST_PROGRESS, playlist, done, total)` while tracks resolve and
+    `(PLAYLIST_DONE, playlist, result, error)` as each playlist finishes, all on the
+    caller's thread so it can update the UI. With a `job`, finished playlists are
+    skipped and a playlist interrupted mid-way is completed rather than recreated.
+    With a `sync`, playlists unchanged since the last sync are skipped as well.
+    `tracks` maps playlist IDs to items fetched ahead of time; the others are
+    fetched as they are transferred.
+
+    Closing the generator stops the transfer: no playlist is started and no track
+    appended after that, and it returns once the requests in flight are done.
+    """
+    events = queue.Queue()
+    stop = threading.Event()
+    checkpoints = job.load('playlists') if job is not None else {}
+    created = {playlist_id: tidal_playlist_id for playlist_id, (_, tidal_playlist_id) in checkpoints.items()}
+
+    def transfer(playlist):
+        if stop.is_set():
+            raise TransferCancelled(playlist.get('name', 'Unnamed Playlist'))
+
+        def on_progress(done, total):
+            events.put((PLAYLIST_PROGRESS, playlist, done, total))
+
+        def on_created(tidal_playlist_id):
+            created[playlist['id']] = tidal_playlist_id
+            if job is not None:
+                job.mark('playlists', playlist['id'], MATCHED, tidal_playlist_id)
+
+        return transfer_playlist(pool, sp, tidal, playlist, cache=cache, chunk_size=chunk_size,
+                                 on_progress=on_progress, tidal_playlist_id=created.get(playlist['id']),
+                                 on_created=on_created, sync=sync, catalog=catalog,
+                                 tracks=(tracks or {}).get(playlist['id']), stop=stop)
+
+    pending = []
+    for playlist in playlists:
+        if (checkpoints.get(playlist['id'], (None,))[0] in FINISHED
+                or (sync is not None and sync.playlist_unchanged(playlist))):
+            yield PLAYLIST_SKIPPED, playlist, None, None
+        else:
+            pending.append(playlist)
+
+    def run():
+        results = pool.map(transfer, pending, max_workers=parallel)
+        try:
+            for playlist, result, error in results:
+                if stop.is_set():
+                    # Playlists cut short stay checkpointed with their Tidal ID, to be completed on resume
+                    break
+                if job is not None:
+                    job.mark('playlists', playlist['id'], FAILED if error is not None else WRITTEN,
+                             created.get(playlist['id']), error)
+                if sync is not None and error is None:
+                    sync.commit_playlist(playlist)
+                events.put((PLAYLIST_DONE, playlist, result, error))
+            events.put(None)
+        except Exception as e:
+            events.put(e)
+        finally:
+            results.close()
+
+    runner = threading.Thread(target=run, daemon=True)
+    runner.start()
+    try:
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        stop.set()
+        runner.join()
+
+
+def is_own_playlist(playlist, user_id):
+    if not playlist or not isinstance(playlist, dict) or not playlist.get('id'):
+        return False
+    owner = playlist.get('owner')
+    if not owner or not isinstance(owner, dict):
+        return False
+    return owner.get('id') == user_id